@@ -0,0 +1,60 @@
+# Benchmark the startup time of the ncpt command-line interface and list the
+# heavy dependencies imported by each command. Each command runs in a fresh
+# interpreter (the best of several runs is reported).
+# Run from the top-level directory of the repo:
+#   python -m benchmarks.bench_cli
+import os
+import sys
+import subprocess
+import tempfile
+import time
+
+
+heavy = ['numpy', 'pandas', 'yaml', 'pyarrow', 'scipy', 'matplotlib', 'seaborn', 'statsmodels']
+
+runner = ('import sys\n'
+          'from lumos_ncpt_tools.cli import main\n'
+          'try:\n'
+          '    main(sys.argv[1:])\n'
+          'except SystemExit:\n'
+          '    pass\n'
+          'heavy = {heavy!r}\n'
+          'sys.stderr.write("loaded:" + ",".join(m for m in heavy if m in sys.modules))\n')
+
+
+def run(args, reps=5):
+    code = runner.format(heavy=heavy)
+    best = float('inf')
+    for _ in range(reps):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', code] + args, capture_output=True,
+                             text=True, check=True)
+        best = min(best, time.perf_counter() - start)
+    loaded = out.stderr.strip().splitlines()[-1][len('loaded:'):]
+    return best, loaded or '-'
+
+
+def main():
+    data = os.path.join('.', 'demo_data.csv')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        commands = {'python (baseline)': None,
+                    'ncpt --help': ['--help'],
+                    'ncpt filter-complete --help': ['filter-complete', '--help'],
+                    'ncpt filter-complete': ['filter-complete', data,
+                                             os.path.join(tmp_dir, 'complete.csv')],
+                    'ncpt filter-outliers': ['filter-outliers', data,
+                                             os.path.join(tmp_dir, 'filt.csv'), '--thresh', '4'],
+                    'ncpt validate': ['validate', data]}
+        print(f'{"command":<30}{"time":>10}  imported')
+        for name, args in commands.items():
+            if args is None:
+                start = time.perf_counter()
+                subprocess.run([sys.executable, '-c', 'pass'], check=True)
+                elapsed, loaded = time.perf_counter() - start, '-'
+            else:
+                elapsed, loaded = run(args)
+            print(f'{name:<30}{elapsed:>9.3f}s  {loaded}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# Benchmark the outlier scale estimators against naive O(n^2) implementations.
+# Run from the top-level directory of the repo:
+#   python -m benchmarks.bench_outliers
+import time
+
+import numpy as np
+
+from lumos_ncpt_tools.stats import median_abs_dev, quantiles, sn_scale, qn_scale
+
+
+def naive_sn(x):
+    n = len(x)
+    diffs = np.sort(np.abs(x[:, None] - x[None, :]), axis=1)
+    return np.sort(diffs[:, n // 2])[(n + 1) // 2 - 1]
+
+
+def naive_qn(x):
+    n = len(x)
+    h = n // 2 + 1
+    i, j = np.triu_indices(n, 1)
+    return np.sort(np.abs(x[i] - x[j]))[h * (h - 1) // 2 - 1]
+
+
+def timeit(func, x, reps=3):
+    best = float('inf')
+    for _ in range(reps):
+        start = time.perf_counter()
+        func(x)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rng = np.random.default_rng(0)
+    estimators = {'MAD': lambda x: median_abs_dev(x)[0],
+                  'IQR': lambda x: quantiles(x, [0.25, 0.75]),
+                  'Sn': sn_scale,
+                  'Qn': qn_scale,
+                  'Sn (naive)': naive_sn,
+                  'Qn (naive)': naive_qn}
+    naive_max_n = 4000
+    print(f'{"N":>10}' + ''.join(f'{name:>14}' for name in estimators))
+    for n in [1000, 4000, 10**5, 10**6, 4 * 10**6]:
+        # Integer-valued scores with many ties, like the NCPT raw scores
+        x = rng.integers(0, 60, n).astype(float)
+        row = f'{n:>10}'
+        for name, func in estimators.items():
+            if 'naive' in name and n > naive_max_n:
+                row += f'{"-":>14}'
+            else:
+                row += f'{timeit(func, x):>13.4f}s'
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+# The ncpt command-line interface; run `ncpt --help` (or
+# `python -m lumos_ncpt_tools.cli --help`) for usage.
+# Only the standard library is imported at startup: numpy/pandas/yaml (and
+# optional dependencies such as pyarrow) are imported inside the subcommands
+# that need them, so `ncpt --help` and argument errors return immediately.
+import argparse
+import os
+import sys
+
+
+# Keep in sync with OutliersMixin.supported_methods (not imported here, since
+# that would import pandas at startup).
+outlier_methods = ['MAD', 'IQR', 'robust_z', 'Sn', 'Qn']
+
+
+def main(argv=None):
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    return args.func(args) or 0
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(
+        prog='ncpt', description='Tools for working with the NCPT data.')
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+
+    p = subparsers.add_parser('stats', help='Display summary statistics for a data file.')
+    _add_load_args(p)
+    p.set_defaults(func=_stats)
+
+    p = subparsers.add_parser(
+        'filter-complete', help='Keep only test runs in which the entire battery was completed.')
+    _add_load_args(p)
+    _add_save_args(p)
+    p.add_argument('--batteries', type=int, nargs='+', default=None,
+                   help='Battery IDs to screen (default: all batteries in the data).')
+    p.set_defaults(func=_filter_complete)
+
+    p = subparsers.add_parser(
+        'filter-outliers', help='Remove test runs with outlier scores on any subtest.')
+    _add_load_args(p)
+    _add_save_args(p)
+    p.add_argument('--thresh', type=float, required=True, help='Outlier threshold.')
+    p.add_argument('--method', choices=outlier_methods, default='MAD',
+                   help='Outlier method (default: MAD).')
+    p.add_argument('--score-col', default='raw_score',
+                   help='Column with the scores to screen (default: raw_score).')
+    p.add_argument('--subtests', type=int, nargs='+', default=None,
+                   help='Subtest IDs to screen (default: all subtests in the data).')
+    p.set_defaults(func=_filter_outliers)
+
+    p = subparsers.add_parser(
+        'norms', help='Make the demographic norm tables (requires the manuscript directory '
+                      'of the repo, i.e. run from the top-level directory of the repo).')
+    p.add_argument('data_dir', help='Directory with the battery{id}_df.csv files.')
+    p.add_argument('save_dir', help='Directory where the tables are saved.')
+    p.add_argument('--n-boot', type=int, default=1000,
+                   help='Number of bootstrap samples for the confidence intervals '
+                        '(0 to skip; default: 1000).')
+    p.add_argument('--ci', type=float, default=95, help='Confidence level (default: 95).')
+    p.add_argument('--seed', type=int, default=0, help='Random seed (default: 0).')
+    p.add_argument('--n-jobs', type=int, default=None,
+                   help='Number of threads for bootstrapping (default: all cores).')
+    p.add_argument('--fmt', default='.csv', help='Output format (default: .csv).')
+    p.set_defaults(func=_norms)
+
+    p = subparsers.add_parser(
+        'validate', help='Check a data file for problems in a single streaming pass '
+                         '(exit status 1 if any rows violate a rule).')
+    p.add_argument('data', help='Path to the data file (CSV).')
+    p.add_argument('--chunksize', type=int, default=10**6,
+                   help='Number of rows read at a time (default: 1000000).')
+    p.set_defaults(func=_validate)
+
+    p = subparsers.add_parser(
+        'convert', help='Convert a data file to (compressed) CSV, Parquet or Feather.')
+    _add_load_args(p)
+    _add_save_args(p)
+    p.set_defaults(func=_convert)
+    return parser
+
+
+def _add_load_args(p):
+    p.add_argument('data', help='Path to the data file (CSV).')
+    p.add_argument('--nrows', type=int, default=None, help='Number of rows to load.')
+    p.add_argument('--max-memory', default=None,
+                   help="Memory budget for loading the data, e.g. '4GB' (see utils.load_data).")
+
+
+def _add_save_args(p):
+    p.add_argument('out', help='Output path; the format is inferred from the extension '
+                               '(.csv, .csv.gz, .csv.bz2, .csv.xz, .parquet, .feather). '
+                               'A directory if --partition-by is provided.')
+    p.add_argument('--fmt', default=None, help='Output format, if not inferred from out.')
+    p.add_argument('--partition-by', nargs='+', default=None,
+                   help='Column(s) to partition the output by.')
+    p.add_argument('--n-jobs', type=int, default=1,
+                   help='Number of partitions written in parallel (default: 1).')
+
+
+def _load(args):
+    from .ncpt import NCPT
+    from .utils import load_data
+
+    data_path, fn = os.path.split(os.path.abspath(args.data))
+    nrows = 'all' if args.nrows is None else args.nrows
+    return NCPT(load_data(data_path, fn, nrows=nrows, max_memory=args.max_memory))
+
+
+def _save(df, args):
+    from .writers import write_df
+
+    write_df(df, args.out, fmt=args.fmt, partition_by=args.partition_by, n_jobs=args.n_jobs)
+    print(f'Saved data to {args.out}')
+
+
+def _stats(args):
+    ncpt = _load(args)
+    ncpt.report_stats()
+    ncpt.get_subtest_info()
+
+
+def _filter_complete(args):
+    ncpt = _load(args)
+    filt_df, exclude_df = ncpt.filter_by_completeness(ids=args.batteries)
+    n_kept = filt_df['test_run_id'].nunique()
+    n_excluded = exclude_df['test_run_id'].nunique()
+    print(f'Kept {n_kept} complete test runs, excluded {n_excluded} incomplete test runs')
+    _save(filt_df, args)
+
+
+def _filter_outliers(args):
+    ncpt = _load(args)
+    subtests = args.subtests
+    if subtests is None:
+        subtests = sorted(ncpt.df['specific_subtest_id'].unique())
+    filt_df = ncpt.filter_outliers_by_subtest(args.score_col, args.thresh, subtests,
+                                              method=args.method)
+    n_kept = filt_df['test_run_id'].nunique()
+    n_total = ncpt.df['test_run_id'].nunique()
+    print(f'Kept {n_kept} of {n_total} test runs')
+    _save(filt_df, args)
+
+
+def _norms(args):
+    # The manuscript modules are not part of the package; they are imported
+    # from the current directory (the top-level directory of the repo).
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    try:
+        from manuscript.norm_tables import NormTables
+    except ImportError:
+        sys.exit('ncpt norms: could not import manuscript.norm_tables; run it from the '
+                 'top-level directory of the lumos-ncpt-tools repo')
+    norms = NormTables(args.data_dir, args.save_dir, n_boot=args.n_boot, ci=args.ci,
+                       seed=args.seed, n_jobs=args.n_jobs, fmt=args.fmt)
+    norms.make_tables()
+
+
+def _validate(args):
+    from .ncpt import NCPT
+    from .utils import iter_chunks
+
+    data_path, fn = os.path.split(os.path.abspath(args.data))
+    report = NCPT(None).validate(chunks=iter_chunks(data_path, fn, args.chunksize))
+    report.summary()
+    return 0 if report.ok else 1
+
+
+def _convert(args):
+    ncpt = _load(args)
+    _save(ncpt.df, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
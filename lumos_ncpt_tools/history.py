@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+
+class RunHistory:
+    """Compressed (CSR-style) index of each user's test run history:
+    users -> test runs -> subtest scores.
+
+    Runs of a user are stored contiguously and in order of test_run_id
+    (test run IDs are assigned sequentially, so this is the order in which
+    the runs were taken). Scores of a run are stored contiguously and sorted
+    by subtest ID. All operations are vectorized over users.
+
+    Use NCPT.build_history_index to build the index from a NCPT dataset.
+
+    Args
+    ----
+    df (DataFrame): DataFrame containing NCPT data.
+    score_col (str, optional): Name of the column with the scores to index.
+
+    Attributes
+    ----------
+    user_ids (ndarray): Sorted unique user IDs.
+    user_ptr (ndarray): Runs of user_ids[u] are run_ids[user_ptr[u]:user_ptr[u+1]].
+    run_ids, run_battery, run_time_of_day (ndarray): Test run ID, battery ID and
+        time of day of each run.
+    run_ptr (ndarray): Scores of run r are subtest_ids/scores[run_ptr[r]:run_ptr[r+1]].
+    subtest_ids, scores (ndarray): Subtest ID and score of each completed subtest.
+    """
+
+    def __init__(self, df, score_col='raw_score'):
+        users = df['user_id'].to_numpy()
+        runs = df['test_run_id'].to_numpy()
+        subs = df['specific_subtest_id'].to_numpy()
+        order = np.lexsort((subs, runs, users))
+        users, runs, subs = users[order], runs[order], subs[order]
+        # Drop duplicated (test run, subtest) scores, keeping the first
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = (runs[1:] != runs[:-1]) | (subs[1:] != subs[:-1])
+        order, users, runs, subs = order[keep], users[keep], runs[keep], subs[keep]
+
+        self.subtest_ids = subs
+        self.scores = df[score_col].to_numpy(dtype=float)[order]
+        run_start = np.flatnonzero(np.r_[True, runs[1:] != runs[:-1]])
+        self.run_ptr = np.r_[run_start, len(runs)]
+        self.run_ids = runs[run_start]
+        self.run_battery = df['battery_id'].to_numpy()[order][run_start]
+        if 'time_of_day' in df.columns:
+            self.run_time_of_day = df['time_of_day'].to_numpy()[order][run_start]
+        else:
+            self.run_time_of_day = None
+        run_users = users[run_start]
+        user_start = np.flatnonzero(np.r_[True, run_users[1:] != run_users[:-1]])
+        self.user_ptr = np.r_[user_start, len(run_users)]
+        self.user_ids = run_users[user_start]
+
+    @property
+    def n_users(self):
+        return len(self.user_ids)
+
+    def run_counts(self):
+        """Return the number of test runs taken by each user (Series indexed by user ID)."""
+        return pd.Series(np.diff(self.user_ptr), index=self.user_ids, name='n_runs')
+
+    def run_count_distribution(self):
+        """Return the number of users (values) that took each number of test runs (index)."""
+        counts = np.bincount(np.diff(self.user_ptr))
+        nonzero = np.flatnonzero(counts)
+        return pd.Series(counts[nonzero], index=pd.Index(nonzero, name='n_runs'), name='n_users')
+
+    def user_runs(self, user_id):
+        """Return the run history of a single user as a DataFrame with one row per
+        completed subtest, in the order the runs were taken."""
+        u = np.searchsorted(self.user_ids, user_id)
+        assert u < self.n_users and self.user_ids[u] == user_id, 'User ID not found!'
+        run_lo, run_hi = self.user_ptr[u], self.user_ptr[u + 1]
+        lo, hi = self.run_ptr[run_lo], self.run_ptr[run_hi]
+        n_scores = np.diff(self.run_ptr[run_lo:run_hi + 1])
+        history = {'run_number': np.repeat(np.arange(run_hi - run_lo), n_scores),
+                   'test_run_id': np.repeat(self.run_ids[run_lo:run_hi], n_scores),
+                   'battery_id': np.repeat(self.run_battery[run_lo:run_hi], n_scores)}
+        if self.run_time_of_day is not None:
+            history['time_of_day'] = np.repeat(self.run_time_of_day[run_lo:run_hi], n_scores)
+        history['specific_subtest_id'] = self.subtest_ids[lo:hi]
+        history['score'] = self.scores[lo:hi]
+        return pd.DataFrame(history)
+
+    def subtest_history(self, subtest_id):
+        """Return every score for one subtest, along with the index of the user
+        (into user_ids) and the attempt number (0 for the user's first completion
+        of the subtest, 1 for the second, ...).
+
+        Returns
+        -------
+        user_idx (ndarray): Index into user_ids for each score.
+        attempt (ndarray): Attempt number for each score.
+        scores (ndarray): Scores, grouped by user and in order of attempt.
+        """
+        entries = np.flatnonzero(self.subtest_ids == subtest_id)
+        entry_run = np.searchsorted(self.run_ptr, entries, side='right') - 1
+        user_idx = np.searchsorted(self.user_ptr, entry_run, side='right') - 1
+        # Entries are grouped by user, so the attempt number is the position
+        # relative to the user's first entry
+        first = np.r_[True, user_idx[1:] != user_idx[:-1]]
+        first_pos = np.maximum.accumulate(np.where(first, np.arange(len(entries)), 0))
+        attempt = np.arange(len(entries)) - first_pos
+        return user_idx, attempt, self.scores[entries]
+
+    def nth_scores(self, subtest_id, n):
+        """Return each user's score on their nth (0-based) attempt of a subtest
+        (Series indexed by user ID; users with fewer attempts are omitted)."""
+        user_idx, attempt, scores = self.subtest_history(subtest_id)
+        sel = attempt == n
+        return pd.Series(scores[sel], index=self.user_ids[user_idx[sel]], name=n)
+
+    def retest_deltas(self, subtest_id, n=1):
+        """Return the change in score from the first to the nth (0-based) attempt
+        of a subtest for each user with at least n + 1 attempts (Series indexed
+        by user ID), e.g. to estimate practice effects."""
+        first, nth = self._paired_scores(subtest_id, n)
+        return (nth - first).rename('delta')
+
+    def retest_correlations(self, subtests=None, n=1):
+        """Test-retest reliability: Pearson correlation between the scores on the
+        first and the nth (0-based) attempt of each subtest.
+
+        Args
+        ----
+        subtests (list, optional): Subtest IDs. If set to None (the default), all
+            subtests in the index are used.
+        n (int, optional): Attempt to correlate with the first attempt.
+
+        Returns
+        -------
+        retest_df (DataFrame): Retest correlation ('r'), number of users ('N'), and mean
+            first to nth attempt change in score ('mean_delta') for each subtest.
+        """
+
+        if subtests is None:
+            subtests = np.unique(self.subtest_ids)
+        rows = []
+        for sub in subtests:
+            first, nth = self._paired_scores(sub, n)
+            if len(first) > 1:
+                r = np.corrcoef(first.values, nth.values)[0, 1]
+            else:
+                r = np.nan
+            rows.append([sub, r, len(first), (nth - first).mean()])
+        retest_df = pd.DataFrame(rows, columns=['specific_subtest_id', 'r', 'N', 'mean_delta'])
+        return retest_df.set_index('specific_subtest_id')
+
+    def _paired_scores(self, subtest_id, n):
+        user_idx, attempt, scores = self.subtest_history(subtest_id)
+        nth_sel = attempt == n
+        # The first attempt of a user is n positions before their nth attempt
+        first_pos = np.flatnonzero(nth_sel) - n
+        index = self.user_ids[user_idx[nth_sel]]
+        first = pd.Series(scores[first_pos], index=index)
+        nth = pd.Series(scores[nth_sel], index=index)
+        return first, nth
@@ -6,9 +6,11 @@ import pkgutil
 import pandas as pd
 import numpy as np
 
+from . import stats
+
 
 class OutliersMixin:
-    supported_methods = {'MAD'}
+    supported_methods = {'MAD', 'IQR', 'robust_z', 'Sn', 'Qn'}
     
     def filter_outliers_by_subtest(self, score_col, thresh, subtests, method='MAD', df=None):
         """Identify and remove test runs with outlier scores, return the filtered
@@ -20,11 +22,24 @@ class OutliersMixin:
         score_col (str): Name of the column with scores to screen for outliers. 
         thresh (float): Outlier threshold (details provided in 'method' argument).
         subtests (list): List of specific subtest IDs to check for outliers. 
-        method (str, optional): Method used to identify outliers. Currently
-            only 'MAD' is supported. For the 'MAD' method, the median absolute
-            deviation from the median (MAD) of the scores is calculated.
-            Scores whose absolute deviation from the median exceeds 
-            'thresh' x the MAD are identified as outliers. 
+        method (str, optional): Method used to identify outliers. One of:
+            'MAD': the median absolute deviation from the median (MAD) of the
+                scores is calculated. Scores whose absolute deviation from the 
+                median exceeds 'thresh' x the MAD are identified as outliers. 
+            'robust_z': robust z-scores, (score - median) / (1.4826 x MAD), are
+                calculated. Scores whose absolute robust z-score exceeds
+                'thresh' are identified as outliers.
+            'IQR': Tukey fences. Scores below Q1 - 'thresh' x IQR or above
+                Q3 + 'thresh' x IQR are identified as outliers (thresh = 1.5
+                is the conventional choice). 
+            'Sn', 'Qn': the Rousseeuw-Croux Sn or Qn scale estimates are used 
+                in place of the MAD, i.e. scores whose absolute deviation from 
+                the median exceeds 'thresh' x Sn (or Qn) are identified as 
+                outliers. Both are computed in O(n log n) time.
+            The quantiles/medians used by all methods are computed with O(n) 
+            partition-based selection. If the scale estimate (MAD, IQR, Sn or 
+            Qn) of a subtest is 0, which can happen with heavily tied scores, 
+            no outliers are flagged for that subtest.
         df (DataFrame, optional): DataFrame containing scores to be screend for outliers.
             If set to None (the default), self.df is used (i.e., the df attribute of the NCPT
             class instance). 
@@ -68,15 +83,218 @@ class OutliersMixin:
         assert method in self.supported_methods, 'Outlier method not supported!' 
         outlier_df = df.copy(deep=True)
         scores = outlier_df[score_col].values        
-        if method == 'MAD':
-            mad, devs = self._median_absolute_dev(scores)
-            outlier_df.loc[:, 'devs'] = devs
-            outlier_ids = set(outlier_df.query('devs >= @thresh * @mad')['test_run_id'].unique())        
+        is_outlier, scale = self._outlier_mask(scores, thresh, method)
+        if scale == 0:
+            print(f'Subtest ID {subtest_id}: {method} scale is 0 (tied scores), '
+                  'no outliers flagged')
+        outlier_df.loc[:, 'is_outlier'] = is_outlier
+        outlier_ids = set(outlier_df.query('is_outlier')['test_run_id'].unique())        
         print(f'Subtest ID {subtest_id}: N outliers = {len(outlier_ids)}')
         return outlier_ids   
+
+    def _outlier_mask(self, scores, thresh, method):
+        # Returns the outlier mask and the scale estimate (IQR for 'IQR'). NaN 
+        # scores are never flagged as outliers. If the scale is 0 (e.g. Qn on 
+        # heavily tied integer scores), every score off the median would be 
+        # flagged, so no outliers are flagged.
+        mask = np.zeros(len(scores), dtype=bool)
+        valid = ~np.isnan(scores)
+        x = scores[valid]
+        if len(x) == 0:
+            return mask, np.nan
+        if method == 'IQR':
+            q1, q3 = stats.quantiles(x, [0.25, 0.75])
+            scale = q3 - q1
+            if scale > 0:
+                mask[valid] = (x < q1 - thresh * scale) | (x > q3 + thresh * scale)
+            return mask, scale
+        median = stats.median(x)
+        if method == 'MAD':
+            scale, devs = self._median_absolute_dev(x, median)
+        elif method == 'robust_z':
+            mad, devs = self._median_absolute_dev(x, median)
+            scale = mad * stats.MAD_CONST
+        elif method == 'Sn':
+            scale, devs = stats.sn_scale(x), np.abs(x - median)
+        elif method == 'Qn':
+            scale, devs = stats.qn_scale(x), np.abs(x - median)
+        if scale > 0:
+            mask[valid] = devs >= thresh * scale
+        return mask, scale
                                 
     def _median_absolute_dev(self, data, median=None):
-        if median is None:
-            median = np.median(data)
-        devs = np.abs(data - median)
-        return np.median(devs), devs                                              
\ No newline at end of file
+        return stats.median_abs_dev(data, median)
+
+
+class AdjustmentMixin:
+    """Demographic adjustment of subtest scores with per-subtest OLS models
+    of the form score ~ age + C(education_level) + C(gender). 
+    
+    The models are fit out-of-core: for each subtest x education level x gender
+    cell, the sums needed for the normal equations (N, sum of age, age^2, score
+    and age x score) are accumulated chunk by chunk, so the full dataset never
+    needs to be in memory. The factor levels are taken from the data, as they
+    would be by statsmodels/patsy, and X'X / X'y are assembled from the cell sums
+    once all chunks have been seen. Adjusted scores are the residuals of the 
+    fitted models.
+    """
+    
+    adjustment_sums = ['n', 'age', 'age2', 'y', 'age_y']
+    
+    def fit_demog_adjustment(self, score_col='raw_score', chunks=None, chunksize=1e6):
+        """Fit the per-subtest demographic adjustment models. Rows with missing 
+        scores/demographics are ignored, as they would be by statsmodels. The 
+        education levels and genders are the levels observed in the data (sorted;
+        the first level is the reference level). Coefficients of levels that were
+        not observed for a given subtest are NaN.
+
+        Args
+        ----
+        score_col (str, optional): Name of the column with scores to adjust.
+        chunks (iterable, optional): Iterable of DataFrame chunks to fit the models 
+            on, e.g. the output of utils.iter_chunks for a dataset that does not fit 
+            in memory. If set to None (the default), self.df is used.
+        chunksize (int, optional): Number of rows of self.df to process at a time
+            (only used if chunks is None).
+            
+        Returns
+        -------
+        coefs (DataFrame): Fitted coefficients, one row per subtest. Column names 
+            follow the statsmodels/patsy naming for the same formula. 
+        """
+        
+        if chunks is None:
+            chunks = self._iter_df_chunks(chunksize)
+        keys = ['specific_subtest_id', 'education_level', 'gender']
+        cell_sums = None
+        for chunk in chunks:
+            age = chunk['age'].to_numpy(dtype=float)
+            y = chunk[score_col].to_numpy(dtype=float)
+            cells = pd.DataFrame({'specific_subtest_id': chunk['specific_subtest_id'].to_numpy(),
+                                  'education_level': chunk['education_level'].to_numpy(),
+                                  'gender': chunk['gender'].to_numpy(dtype=object),
+                                  'n': 1.0, 'age': age, 'age2': age**2, 'y': y, 'age_y': age * y})
+            cells = cells[~np.isnan(age) & ~np.isnan(y) & cells[keys].notna().all(axis=1).values]
+            chunk_sums = cells.groupby(keys, sort=False)[self.adjustment_sums].sum()
+            cell_sums = chunk_sums if cell_sums is None else cell_sums.add(chunk_sums, fill_value=0)
+        assert cell_sums is not None and len(cell_sums) > 0, 'No valid rows to fit!'
+        
+        cell_sums = cell_sums.reset_index()
+        self.adjustment_edu_levels = self._sorted_levels(cell_sums['education_level'])
+        self.adjustment_genders = self._sorted_levels(cell_sums['gender'])
+        col_names = self._adjustment_col_names()
+        coefs, n_obs = {}, {}
+        for sub, sub_sums in cell_sums.groupby('specific_subtest_id'):
+            # Indicator part of the design row of each cell: intercept, education
+            # and gender dummies
+            Z = self._adjustment_indicators(sub_sums['education_level'], sub_sums['gender'])
+            n, age, age2, y, age_y = sub_sums[self.adjustment_sums].to_numpy().T
+            n_ind = Z.shape[1]
+            xtx = np.zeros((n_ind + 1, n_ind + 1))
+            xtx[:n_ind, :n_ind] = (Z * n[:, None]).T @ Z
+            xtx[:n_ind, -1] = xtx[-1, :n_ind] = Z.T @ age
+            xtx[-1, -1] = age2.sum()
+            xty = np.r_[Z.T @ y, age_y.sum()]
+            # Only the columns of observed levels are estimable
+            observed = np.r_[True, Z[:, 1:].any(axis=0), True]
+            sub_coefs = np.full(len(col_names), np.nan)
+            sub_coefs[observed] = np.linalg.lstsq(
+                xtx[np.ix_(observed, observed)], xty[observed], rcond=None)[0]
+            coefs[sub] = sub_coefs
+            n_obs[sub] = int(n.sum())
+        self.adjustment_coefs = pd.DataFrame.from_dict(coefs, orient='index', columns=col_names)
+        self.adjustment_coefs.index.name = 'specific_subtest_id'
+        self.adjustment_n = pd.Series(n_obs, name='N').sort_index()
+        self.adjustment_score_col = score_col
+        return self.adjustment_coefs
+    
+    def iter_adjusted_scores(self, chunks=None, chunksize=1e6, adjusted_col='adjusted_score'):
+        """Stream demographically adjusted scores (residuals of the models fit with
+        fit_demog_adjustment). Rows that could not be adjusted (missing scores or 
+        demographics, subtests without a fitted model, or education levels / genders
+        that were not observed for the subtest when fitting) are given NaN. 
+
+        Args
+        ----
+        chunks (iterable, optional): Iterable of DataFrame chunks to adjust. If set
+            to None (the default), self.df is used.
+        chunksize (int, optional): Number of rows of self.df to process at a time
+            (only used if chunks is None).
+        adjusted_col (str, optional): Name of the column added with the adjusted scores.
+            
+        Yields
+        ------
+        chunk (DataFrame): Copy of each chunk with the adjusted scores added.
+        """
+        
+        assert hasattr(self, 'adjustment_coefs'), 'Call fit_demog_adjustment first!'
+        coefs = self.adjustment_coefs
+        if chunks is None:
+            chunks = self._iter_df_chunks(chunksize)
+        for chunk in chunks:
+            X, y, valid = self._adjustment_design(chunk, self.adjustment_score_col)
+            subtests = chunk['specific_subtest_id'].values
+            fitted = valid & np.isin(subtests, coefs.index)
+            row_coefs = coefs.reindex(subtests[fitted]).values
+            X_fit = X[fitted]
+            # Rows with a level whose coefficient could not be estimated
+            unobserved = ((X_fit != 0) & np.isnan(row_coefs)).any(axis=1)
+            residuals = y[fitted] - np.einsum('ij,ij->i', X_fit, np.nan_to_num(row_coefs))
+            adjusted = np.full(len(chunk), np.nan)
+            adjusted[fitted] = np.where(unobserved, np.nan, residuals)
+            chunk = chunk.copy()
+            chunk[adjusted_col] = adjusted
+            yield chunk
+            
+    def adjust_scores(self, adjusted_col='adjusted_score', chunksize=1e6):
+        """Return a copy of self.df with demographically adjusted scores added 
+        (see iter_adjusted_scores). fit_demog_adjustment must be called first.
+        """
+        
+        return pd.concat(self.iter_adjusted_scores(chunksize=chunksize, 
+                                                   adjusted_col=adjusted_col))
+    
+    def _iter_df_chunks(self, chunksize):
+        chunksize = int(chunksize)
+        for start in range(0, len(self.df), chunksize):
+            yield self.df.iloc[start:start + chunksize]
+    
+    def _sorted_levels(self, values):
+        # Unique levels as Python scalars, so that the column names match patsy
+        # (e.g. 'T.2' for integer codes, 'T.2.0' for float codes)
+        return sorted(set(np.asarray(values, dtype=object).tolist()))
+            
+    def _adjustment_col_names(self):
+        # Same column order / names as patsy: intercept, categorical terms, numeric terms
+        edu_names = [f'C(education_level)[T.{level}]' for level in self.adjustment_edu_levels[1:]]
+        gender_names = [f'C(gender)[T.{g}]' for g in self.adjustment_genders[1:]]
+        return ['Intercept'] + edu_names + gender_names + ['age']
+    
+    def _adjustment_indicators(self, edu, gender):
+        # Treatment coded intercept / education / gender columns (the first level
+        # is the reference level). Also returns whether each row has a known level.
+        edu_idx = pd.Categorical(np.asarray(edu, dtype=object), 
+                                 categories=self.adjustment_edu_levels).codes
+        gen_idx = pd.Categorical(np.asarray(gender, dtype=object), 
+                                 categories=self.adjustment_genders).codes
+        n_edu = len(self.adjustment_edu_levels) - 1
+        n_gen = len(self.adjustment_genders) - 1
+        Z = np.zeros((len(edu_idx), 1 + n_edu + n_gen))
+        Z[:, 0] = 1
+        rows = np.arange(len(edu_idx))
+        edu_dummy = edu_idx > 0
+        Z[rows[edu_dummy], edu_idx[edu_dummy]] = 1
+        gen_dummy = gen_idx > 0
+        Z[rows[gen_dummy], n_edu + gen_idx[gen_dummy]] = 1
+        return Z
+    
+    def _adjustment_design(self, df, score_col):
+        edu = df['education_level'].to_numpy(dtype=object)
+        gender = df['gender'].to_numpy(dtype=object)
+        age = df['age'].to_numpy(dtype=float)
+        y = df[score_col].to_numpy(dtype=float)
+        known = (pd.Categorical(edu, categories=self.adjustment_edu_levels).codes >= 0) & \
+            (pd.Categorical(gender, categories=self.adjustment_genders).codes >= 0)
+        valid = ~np.isnan(age) & ~np.isnan(y) & known
+        X = np.c_[self._adjustment_indicators(edu, gender), np.where(valid, age, 0)]
+        return X, y, valid
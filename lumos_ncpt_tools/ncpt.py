@@ -4,15 +4,20 @@ import pandas as pd
 import numpy as np
 import yaml
 
-from .mixins import OutliersMixin
+from .mixins import OutliersMixin, AdjustmentMixin
+from .stats import pairwise_corr
+from .history import RunHistory
+from .validation import Validator
+from .writers import write_df
 
 
-class NCPT(OutliersMixin):
+class NCPT(OutliersMixin, AdjustmentMixin):
     """Methods for filtering and analyzing a NCPT dataset.
     
     Args
     ----
-    df (DataFrame): DataFrame containing NCPT data. 
+    df (DataFrame): DataFrame containing NCPT data. May be None for out-of-core
+        workflows in which all data is passed in chunks (e.g. fit_demog_adjustment).
     """
     
     config_path = '/config/ncpt_config.yaml'
@@ -92,13 +97,136 @@ class NCPT(OutliersMixin):
         exclude_df = df2filt.query('test_run_id not in @keep_run_ids')           
         return filt_df, exclude_df
 
-    def save_df(self, save_path):        
-        """Save the DataFrame from this class instance. 
+    def pairwise_correlations(self, score_col='raw_score', subtests=None, ci=None, df=None,
+                              duplicates='raise'):
+        """Pearson correlations between subtest scores computed over all test runs,
+        without filtering by completeness: each pair of subtests uses every 
+        test run in which both were completed (pairwise-complete correlations).
+        
+        Args
+        ----
+        score_col (str, optional): Name of the column with scores to correlate.
+        subtests (list, optional): Subtest IDs to include (and their order). If set to
+            None (the default), all subtests in df are included.
+        ci (float, optional): If provided, confidence level (in percent) of Fisher-z 
+            confidence intervals for each correlation. 
+        df (DataFrame, optional): DataFrame containing the scores. If set to None 
+            (the default), self.df is used.
+        duplicates (str, optional): How to handle test runs with more than one score
+            for the same subtest (see the duplicate_subtest rule of self.validate). One of:
+            'raise' (the default): raise a ValueError.
+            'drop': ignore the duplicated scores (the subtest is treated as not 
+                completed in that test run).
+            'first': use the first score.
+            'mean': use the mean of the scores (missing scores are ignored).
+            
+        Returns
+        -------
+        corrs (DataFrame): Correlation matrix indexed by subtest ID.
+        n_obs (DataFrame): Number of test runs used for each correlation.
+        ci_lo, ci_hi (DataFrame): Lower / upper CI bounds (None if ci is None).
+        """
+        
+        df = self.df if df is None else df
+        if subtests is None:
+            subtests = np.sort(df['specific_subtest_id'].unique())
+        assert duplicates in ['raise', 'drop', 'first', 'mean'], 'Unsupported duplicates option!'
+        df = df[df['specific_subtest_id'].isin(subtests)]
+        dup_keys = ['test_run_id', 'specific_subtest_id']
+        is_dup = df.duplicated(subset=dup_keys, keep=False).values
+        if is_dup.any():
+            if duplicates == 'raise':
+                n_dup = df[is_dup].groupby(dup_keys).ngroups
+                raise ValueError(f'{n_dup} (test run, subtest) pairs have more than one score; '
+                                 'set duplicates to drop, first or mean')
+            elif duplicates == 'drop':
+                df = df[~is_dup]
+            elif duplicates == 'first':
+                df = df[~df.duplicated(subset=dup_keys, keep='first').values]
+        # Wide test run x subtest matrix (NaN where a subtest was not completed)
+        run_codes, _ = pd.factorize(df['test_run_id'])
+        sub_codes = pd.Index(subtests).get_indexer(df['specific_subtest_id'])
+        n_runs = run_codes.max() + 1 if len(df) else 0
+        scores = df[score_col].to_numpy(dtype=float)
+        if is_dup.any() and duplicates == 'mean':
+            scored = ~np.isnan(scores)
+            sums = np.zeros((n_runs, len(subtests)))
+            counts = np.zeros((n_runs, len(subtests)))
+            np.add.at(sums, (run_codes[scored], sub_codes[scored]), scores[scored])
+            np.add.at(counts, (run_codes[scored], sub_codes[scored]), 1)
+            with np.errstate(invalid='ignore'):
+                wide = sums / counts
+        else:
+            wide = np.full((n_runs, len(subtests)), np.nan)
+            wide[run_codes, sub_codes] = scores
+        
+        results = pairwise_corr(wide, ci=ci)
+        frames = [None if res is None else pd.DataFrame(res, index=subtests, columns=subtests)
+                  for res in results]
+        return tuple(frames)
+
+    def build_history_index(self, score_col='raw_score', df=None):
+        """Build an index of each user's test run history for practice effect /
+        test-retest analyses (see history.RunHistory).
+        
+        Args
+        ----
+        score_col (str, optional): Name of the column with the scores to index.
+        df (DataFrame, optional): DataFrame containing NCPT data. If set to None 
+            (the default), self.df is used.
+            
+        Returns
+        -------
+        history (RunHistory): Index of the runs and scores of each user.
+        """
+        
+        df = self.df if df is None else df
+        return RunHistory(df, score_col=score_col)
+
+    def validate(self, df=None, chunks=None):
+        """Check the data for problems: subtests that are not part of their battery,
+        unknown battery/subtest IDs, duplicated (test run, subtest) rows, test runs 
+        with inconsistent battery/user/demographics/grand index, out-of-range ages 
+        and unknown education levels (see validation.Validator for details).
+        
+        Args
+        ----
+        df (DataFrame, optional): DataFrame to validate. If set to None (the default),
+            self.df is used. 
+        chunks (iterable, optional): Iterable of DataFrame chunks to validate in a 
+            single streaming pass instead of a DataFrame (e.g. the output of
+            utils.iter_chunks for a data file that does not fit in memory). 
+            
+        Returns
+        -------
+        report (ValidationReport): Number and positions of the rows violating each rule.
+        """
+        
+        validator = Validator(self.config)
+        if chunks is not None:
+            return validator.validate_chunks(chunks)
+        return validator.validate(self.df if df is None else df)
+
+    def save_df(self, save_path, fmt=None, mask=None, partition_by=None, n_jobs=1, chunksize=1e6):        
+        """Save the DataFrame from this class instance, along with a small manifest
+        (row counts, schema hash) for validating the output (see writers.write_df). 
         
         Args
         ----        
-        save_path (str): Path where self.df is to be saved (e.g. '/home/data.csv')
+        save_path (str): Path where self.df is to be saved (e.g. '/home/data.csv').
+            The format is inferred from the extension: '.csv', '.csv.gz', '.csv.bz2', 
+            '.csv.xz', '.parquet' or '.feather' (Parquet/Feather require pyarrow).
+            If partition_by is provided, save_path is a directory. 
+        fmt (str, optional): Output format, if it should not be inferred from save_path.
+        mask (array-like, optional): Boolean mask of the rows of self.df to save, e.g.
+            to save a filtered dataset without making a filtered copy of self.df.
+        partition_by (str or list, optional): Column(s) to partition the output by
+            (e.g. ['battery_id', 'specific_subtest_id']); partitions are written in
+            parallel. 
+        n_jobs (int, optional): Number of partitions written in parallel.
+        chunksize (int, optional): Number of rows written at a time.
         """
         
-        self.df.to_csv(save_path, sep=',', index=False)
+        write_df(self.df, save_path, fmt=fmt, mask=mask, partition_by=partition_by, 
+                 n_jobs=n_jobs, chunksize=chunksize)
         print(f'Saved data to {save_path}')
\ No newline at end of file
@@ -0,0 +1,159 @@
+import os
+import pkgutil
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from .utils import iter_chunks
+from .writers import read_manifest, read_part, partition_values
+
+
+class PooledNCPT:
+    """Pooled view of the NCPT data across all batteries, keyed by general task.
+
+    Different versions of the same task (e.g. Forward memory span, subtest IDs 28
+    and 43) are pooled together. For a given task, only the batteries that include
+    one of its versions are read, only the requested columns are parsed, and only
+    the rows of the task's subtests are kept, so the per-task frame is built
+    without loading (or concatenating) the full battery data.
+
+    Each battery is read from data_dir using the first layout found:
+    1) battery{id}_df/: partitioned directory (written by NCPT.save_df / 
+       writers.write_df with partition_by); if it is partitioned by 
+       specific_subtest_id, only the task's partitions are read.
+    2) battery{id}_df.parquet: Parquet file, read with column projection and a
+       subtest filter pushed down to the reader.
+    3) battery{id}_df.csv: CSV file (as distributed), read in chunks with column
+       projection, keeping the task's rows from each chunk.
+    Batteries without data in data_dir are skipped (see self.batteries).
+
+    Args
+    ----
+    data_dir (str): Directory containing the battery data.
+    chunksize (int, optional): Number of CSV rows read at a time.
+
+    Attributes
+    ----------
+    tasks (dict): Maps each task name to the IDs of its subtest versions.
+    batteries (list): IDs of the batteries with data in data_dir.
+
+    Example
+    -------
+    pooled = PooledNCPT(data_dir)
+    fwd_df = pooled['Forward memory span']
+    """
+
+    config_path = '/config/ncpt_config.yaml'
+    # Column dtypes of the typed frames (ID columns are never missing)
+    dtypes = {'user_id': 'int64', 'age': 'float64', 'gender': 'category',
+              'education_level': 'float64', 'country': 'category', 'test_run_id': 'int64',
+              'battery_id': 'int64', 'specific_subtest_id': 'int64', 'raw_score': 'float64',
+              'time_of_day': 'float64', 'grand_index': 'float64'}
+
+    def __init__(self, data_dir, chunksize=1e6):
+        self.data_dir = data_dir
+        self.chunksize = chunksize
+        self.config = yaml.safe_load(pkgutil.get_data('lumos_ncpt_tools', self.config_path))
+        self.tasks = self._get_tasks()
+        self.batteries = [bat_id for bat_id in self.config['batteries']
+                          if self._battery_layout(bat_id) is not None]
+
+    def __getitem__(self, task):
+        return self.load(task)
+
+    def task_subtests(self, task):
+        """Return the subtest IDs of all versions of a task, given its name or the
+        ID of any of its versions."""
+        if task in self.tasks:
+            return self.tasks[task]
+        for subtests in self.tasks.values():
+            if task in subtests:
+                return subtests
+        raise KeyError(f'Unknown task: {task}')
+
+    def load(self, task, columns=None, batteries=None):
+        """Load the data for all versions of a task from every battery.
+
+        Args
+        ----
+        task (str or int): Task name (e.g. 'Digit symbol coding'; see self.tasks) or
+            the ID of any version of the task.
+        columns (list, optional): Columns to load. If set to None (the default), all
+            columns are loaded. specific_subtest_id and battery_id are always included.
+        batteries (list, optional): Battery IDs to include. If set to None (the
+            default), all batteries with data are included.
+
+        Returns
+        -------
+        task_df (DataFrame): Pooled data for the task, with the dtypes in self.dtypes
+            (an empty frame with these dtypes if no battery has data for the task).
+        """
+
+        subtests = self.task_subtests(task)
+        if columns is not None:
+            columns = list(dict.fromkeys(list(columns) + ['battery_id', 'specific_subtest_id']))
+        pieces = []
+        for bat_id in self.batteries:
+            if batteries is not None and bat_id not in batteries:
+                continue
+            bat_subtests = self.config['batteries'][bat_id][1]
+            bat_task_subtests = [sub for sub in bat_subtests if sub in subtests]
+            if len(bat_task_subtests) == 0:
+                continue
+            pieces.extend(self._read_battery(bat_id, bat_task_subtests, columns))
+        if len(pieces) == 0:
+            columns = list(self.dtypes) if columns is None else columns
+            return pd.DataFrame({col: pd.Series(dtype=self.dtypes.get(col, object))
+                                 for col in columns})
+        task_df = pd.concat(pieces, ignore_index=True)
+        if columns is not None:
+            task_df = task_df[columns]
+        return task_df.astype({col: dtype for col, dtype in self.dtypes.items()
+                               if col in task_df.columns})
+
+    def _get_tasks(self):
+        # Group the subtests by task name; versions are also linked through the
+        # 'other versions' field of the config.
+        tasks = {}
+        for sub_id, (name, _, _, other) in self.config['subtests'].items():
+            tasks.setdefault(name, set()).add(sub_id)
+            if other != 'None':
+                tasks[name].add(int(other))
+        return {name: sorted(subtests) for name, subtests in tasks.items()}
+
+    def _partition_subtest(self, rel_path):
+        # Subtest ID of a partition file, e.g. 29 for both 'specific_subtest_id=29'
+        # and 'specific_subtest_id=29.0' (written from a float column)
+        val = partition_values(rel_path)['specific_subtest_id']
+        return None if val is None else float(val)
+
+    def _battery_layout(self, bat_id):
+        base = os.path.join(self.data_dir, f'battery{bat_id}_df')
+        if os.path.isdir(base):
+            return 'partitioned'
+        for ext in ['.parquet', '.csv']:
+            if os.path.exists(base + ext):
+                return ext
+        return None
+
+    def _read_battery(self, bat_id, subtests, columns):
+        base = os.path.join(self.data_dir, f'battery{bat_id}_df')
+        layout = self._battery_layout(bat_id)
+        if layout == 'partitioned':
+            manifest = read_manifest(base)
+            if 'specific_subtest_id' not in (manifest['partition_by'] or []):
+                # Not partitioned by subtest: filter the rows of every partition
+                pieces = [read_part(base, f, columns, manifest) for f in manifest['files']]
+                return [piece[np.isin(piece['specific_subtest_id'].values, subtests)]
+                        for piece in pieces]
+            files = [f for f in manifest['files'] 
+                     if self._partition_subtest(f['path']) in subtests]
+            return [read_part(base, f, columns, manifest) for f in files]
+        elif layout == '.parquet':
+            return [pd.read_parquet(base + '.parquet', columns=columns,
+                                    filters=[('specific_subtest_id', 'in', subtests)])]
+        dtype = {col: dtype for col, dtype in self.dtypes.items() if dtype != 'category'}
+        chunks = iter_chunks(self.data_dir, f'battery{bat_id}_df.csv', self.chunksize,
+                             usecols=columns, dtype=dtype)
+        return [chunk[np.isin(chunk['specific_subtest_id'].values, subtests)] for chunk in chunks]
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+from .ncpt import NCPT
+from .utils import iter_chunks, iter_run_chunks
+
+
+# Demographic bins (same as the demographic norm tables)
+AGE_BINS = [[18, 29], [30, 39], [40, 49], [50, 59], [60, 69], [70, 99]]
+EDU_BINS = [[1, 2], [3, 4, 8], [5, 6, 7]]
+GENDERS = ['m', 'f']
+
+
+def stratified_sample(data_path, fn, frac, seed=0, chunksize=1e6, usecols=None,
+                      age_bins=AGE_BINS, edu_bins=EDU_BINS, genders=GENDERS):
+    """Draw a stratified random sample of test runs from a NCPT data file in a
+    single streaming pass, without loading the whole file.
+
+    Strata are defined by battery ID and the age / education / gender bins
+    (test runs with missing or unbinned demographics form their own strata).
+    Since whole test runs are sampled, the subtests are stratified through
+    the battery. Within each stratum, round(frac x N) test runs are sampled 
+    without replacement, where N is the number of test runs in the stratum.
+
+    Each test run is given a pseudo-random key from a hash of its test run ID
+    and the seed, and the sample for a stratum consists of the runs with the
+    smallest keys. During the pass, each stratum only keeps a reservoir of 
+    runs whose keys fall below a bound that shrinks as more of the stratum is 
+    seen (frac plus a margin of several binomial standard deviations), so the 
+    memory used is proportional to the size of the sample, not of the file.
+    The sample only depends on the data and the seed (not on chunksize). 
+    The rows of each test run are assumed to be contiguous in the file.
+
+    Args
+    ----
+    data_path (str): Directory containing the data file.
+    fn (str): Name of the data file (e.g. 'battery26_df.csv').
+    frac (float): Fraction of the test runs in each stratum to sample.
+    seed (int, optional): Random seed.
+    chunksize (int, optional): Number of rows to read at a time.
+    usecols (list, optional): Columns to load (the columns defining the strata
+        are always loaded).
+    age_bins, edu_bins, genders (list, optional): Demographic bins.
+
+    Returns
+    -------
+    ncpt (NCPT): NCPT instance containing the sampled test runs, in file order.
+    """
+
+    assert 0 < frac <= 1, 'frac must be in (0, 1]!'
+    strata_cols = ['test_run_id', 'battery_id', 'age', 'education_level', 'gender']
+    if usecols is not None:
+        usecols = list(dict.fromkeys(list(usecols) + strata_cols))
+    counts = pd.Series(dtype=float)
+    cand_rows = None
+    cand_runs = pd.DataFrame({'stratum': pd.Series(dtype=np.int64),
+                              'key': pd.Series(dtype=float)})
+    
+    for chunk in iter_run_chunks(iter_chunks(data_path, fn, chunksize, usecols)):
+        runs = chunk.drop_duplicates(subset=['test_run_id'])
+        strata = _strata_codes(runs, age_bins, edu_bins, genders)
+        counts = counts.add(pd.Series(strata).value_counts(), fill_value=0)
+        keys = _run_keys(runs['test_run_id'].to_numpy(), seed)
+        new_runs = pd.DataFrame({'stratum': strata, 'key': keys},
+                                index=runs['test_run_id'].to_numpy())
+        # Keep the runs below their stratum's current bound, and prune the
+        # earlier candidates with the (smaller) updated bounds.
+        cand_runs = pd.concat([cand_runs, new_runs])
+        bound = _key_bound(counts.reindex(cand_runs['stratum']).to_numpy(), frac)
+        cand_runs = cand_runs[cand_runs['key'].to_numpy() < bound]
+        cand_rows = pd.concat([cand_rows, chunk])
+        cand_rows = cand_rows[cand_rows['test_run_id'].isin(cand_runs.index)]
+
+    # Final sample: the round(frac x N) smallest keys in each stratum
+    cand_runs = cand_runs.sort_values(['stratum', 'key'])
+    rank = cand_runs.groupby('stratum').cumcount().to_numpy()
+    n_keep = np.round(frac * counts.reindex(cand_runs['stratum']).to_numpy())
+    sample_runs = cand_runs[rank < n_keep]
+    return NCPT(cand_rows[cand_rows['test_run_id'].isin(sample_runs.index)])
+
+
+def _key_bound(n, frac):
+    # Upper bound on the key of the round(frac x n)-th smallest of n uniform
+    # keys, which holds except with negligible probability: frac plus 
+    # 6 binomial SDs, plus slack for small strata.
+    with np.errstate(divide='ignore'):
+        return np.minimum(1, frac + 6 * np.sqrt(frac * (1 - frac) / n) + 10 / n)
+
+
+def _run_keys(run_ids, seed):
+    # SplitMix64 hash of the test run IDs, mapped to uniform [0, 1) keys
+    mask = (1 << 64) - 1
+    offset = np.uint64((0x9E3779B97F4A7C15 * (seed + 1)) & mask)
+    z = run_ids.astype(np.uint64) + offset
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)).astype(float) * 2.0 ** -53
+
+
+def _strata_codes(runs, age_bins, edu_bins, genders):
+    # Integer code for battery x age bin x education bin x gender (-1 for 
+    # missing / unbinned demographics)
+    age = runs['age'].to_numpy(dtype=float)
+    age_idx = np.full(len(runs), -1)
+    for i, (lo, hi) in enumerate(age_bins):
+        age_idx[(age >= lo) & (age <= hi)] = i
+    edu = runs['education_level'].to_numpy(dtype=float)
+    edu_idx = np.full(len(runs), -1)
+    for i, levels in enumerate(edu_bins):
+        edu_idx[np.isin(edu, levels)] = i
+    gen_idx = pd.Categorical(runs['gender'], categories=genders).codes.astype(int)
+    battery = runs['battery_id'].to_numpy().astype(np.int64)
+    n_age, n_edu, n_gen = len(age_bins) + 1, len(edu_bins) + 1, len(genders) + 1
+    return ((battery * n_age + age_idx + 1) * n_edu + edu_idx + 1) * n_gen + gen_idx + 1
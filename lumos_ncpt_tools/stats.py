@@ -0,0 +1,368 @@
+from concurrent.futures import ThreadPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+
+
+# Consistency constants and finite-sample correction factors for the
+# Rousseeuw & Croux (1993) scale estimators (Gaussian efficiency).
+SN_CONST = 1.1926
+QN_CONST = 2.2219
+SN_SMALL_N = {2: 0.743, 3: 1.851, 4: 0.954, 5: 1.351, 6: 0.993, 7: 1.198, 8: 1.005, 9: 1.131}
+QN_SMALL_N = {2: 0.399, 3: 0.994, 4: 0.512, 5: 0.844, 6: 0.611, 7: 0.857, 8: 0.669, 9: 0.872}
+# Consistency constant of the MAD (1 / Phi^-1(3/4)), used for robust z-scores
+MAD_CONST = 1.4826
+
+
+def quantiles(data, qs):
+    """Return the requested quantiles of data using a single partition
+    (O(n) introselect) rather than a full sort. Uses the same linear
+    interpolation as np.percentile's default.
+
+    Args
+    ----
+    data (array-like): 1D array of scores (NaNs should be removed beforehand).
+    qs (array-like): Quantiles to compute, each in [0, 1].
+
+    Returns
+    -------
+    vals (ndarray): Quantile values, in the same order as qs.
+    """
+
+    x = np.asarray(data, dtype=float)
+    n = len(x)
+    pos = np.asarray(qs, dtype=float) * (n - 1)
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, n - 1)
+    part = np.partition(x, np.unique(np.concatenate([lo, hi])))
+    frac = pos - lo
+    return part[lo] + frac * (part[hi] - part[lo])
+
+
+def median(data):
+    """O(n) partition-based median."""
+    return quantiles(data, [0.5])[0]
+
+
+def median_abs_dev(data, center=None):
+    """Return the (unscaled) median absolute deviation from the median
+    and the absolute deviations themselves.
+
+    Args
+    ----
+    data (array-like): 1D array of scores.
+    center (float, optional): Center to compute deviations from. Defaults
+        to the median of data.
+
+    Returns
+    -------
+    mad (float): Median absolute deviation.
+    devs (ndarray): Absolute deviations of each score from the center.
+    """
+
+    x = np.asarray(data, dtype=float)
+    if center is None:
+        center = median(x)
+    devs = np.abs(x - center)
+    return median(devs), devs
+
+
+def sn_scale(data, correct=True):
+    """Rousseeuw-Croux Sn scale estimator,
+    Sn = c * lomed_i himed_j |x_i - x_j|.
+
+    The inner high median for every i is the k-th smallest element of
+    the union of two sorted sequences (differences to the left and to the
+    right of x_i in the sorted data), so it is found with a binary search
+    that is vectorized across all i. Total cost is O(n log n).
+
+    Args
+    ----
+    data (array-like): 1D array of scores.
+    correct (bool, optional): If True (the default), apply the consistency
+        constant and finite-sample correction so that Sn estimates the
+        standard deviation for Gaussian data.
+
+    Returns
+    -------
+    sn (float): Sn scale estimate.
+    """
+
+    x = np.sort(np.asarray(data, dtype=float))
+    n = len(x)
+    if n < 2:
+        return 0.0
+    idx = np.arange(n)
+    # Differences to the left of x_i: A_i[t] = x_i - x_{i-1-t} (length i).
+    # Differences to the right of x_i: B_i[t] = x_{i+1+t} - x_i (length n-1-i).
+    # The zero difference (j == i) is the smallest element, so the himed
+    # (rank n//2 + 1) is the (n//2)-th smallest element of A_i u B_i.
+    len_a = idx
+    len_b = n - 1 - idx
+    k = n // 2
+    lo = np.maximum(0, k - len_b)
+    hi = np.minimum(k, len_a)
+    # Smallest a (number of elements taken from A_i) with A_i[a] >= B_i[k-a-1]
+    while np.any(lo < hi):
+        mid = (lo + hi) // 2
+        a_val = x[idx] - x[np.clip(idx - 1 - mid, 0, n - 1)]
+        b_val = x[np.clip(idx + k - mid, 0, n - 1)] - x[idx]
+        done = (mid == len_a) | (mid == k) | (a_val >= b_val)
+        search = lo < hi
+        hi = np.where(search & done, mid, hi)
+        lo = np.where(search & ~done, mid + 1, lo)
+    a = lo
+    a_last = np.where(a > 0, x[idx] - x[np.clip(idx - a, 0, n - 1)], -np.inf)
+    b_last = np.where(k - a > 0, x[np.clip(idx + k - a, 0, n - 1)] - x[idx], -np.inf)
+    himeds = np.maximum(a_last, b_last)
+    # Low median over i
+    sn = np.partition(himeds, (n + 1) // 2 - 1)[(n + 1) // 2 - 1]
+    if correct:
+        if n in SN_SMALL_N:
+            cn = SN_SMALL_N[n]
+        elif n % 2 == 1:
+            cn = n / (n - 0.9)
+        else:
+            cn = 1.0
+        sn *= SN_CONST * cn
+    return sn
+
+
+def qn_scale(data, correct=True):
+    """Rousseeuw-Croux Qn scale estimator, the k-th order statistic of
+    the pairwise distances {|x_i - x_j|; i < j}, with k = h choose 2,
+    h = n//2 + 1.
+
+    The order statistic is found without forming the n^2 distances, using
+    the Johnson-Mizoguchi selection in the implicitly sorted matrix of
+    differences x_j - x_i (as in Croux & Rousseeuw, 1992): the weighted
+    median of the row medians is used as a trial value, rows are narrowed
+    on the correct side of it, and each step discards at least a quarter
+    of the remaining candidates. The per-step ranks are computed with
+    vectorized O(n log n) searches.
+
+    Args
+    ----
+    data (array-like): 1D array of scores.
+    correct (bool, optional): If True (the default), apply the consistency
+        constant and finite-sample correction so that Qn estimates the
+        standard deviation for Gaussian data.
+
+    Returns
+    -------
+    qn (float): Qn scale estimate.
+    """
+
+    x = np.sort(np.asarray(data, dtype=float))
+    n = len(x)
+    if n < 2:
+        return 0.0
+    h = n // 2 + 1
+    k = h * (h - 1) // 2
+    rows = np.arange(n)
+    # Candidate column bounds (inclusive) for each row i; columns j > i
+    left = rows + 1
+    right = np.full(n, n - 1)
+    qn = None
+    while True:
+        width = right - left + 1
+        active = width > 0
+        n_cand = width[active].sum()
+        if n_cand <= n:
+            break
+        act_rows = rows[active]
+        row_meds = x[(left[active] + right[active]) // 2] - x[act_rows]
+        trial = _weighted_median(row_meds, width[active])
+        n_less = _count_diffs(x, trial, strict=True)
+        if k <= n_less.sum():
+            right = np.minimum(right, rows + n_less)
+            continue
+        n_leq = _count_diffs(x, trial, strict=False)
+        if k > n_leq.sum():
+            left = np.maximum(left, rows + n_leq + 1)
+        else:
+            qn = trial
+            break
+    if qn is None:
+        # Few enough candidates left to select the answer directly
+        width = np.maximum(right - left + 1, 0)
+        n_below = (left - rows - 1).sum()
+        cand_rows = np.repeat(rows, width)
+        starts = np.repeat(np.cumsum(width) - width, width)
+        cand_cols = np.repeat(left, width) + np.arange(width.sum()) - starts
+        cands = x[cand_cols] - x[cand_rows]
+        qn = np.partition(cands, k - n_below - 1)[k - n_below - 1]
+    if correct:
+        if n in QN_SMALL_N:
+            dn = QN_SMALL_N[n]
+        elif n % 2 == 1:
+            dn = n / (n + 1.4)
+        else:
+            dn = n / (n + 3.8)
+        qn *= QN_CONST * dn
+    return qn
+
+
+def bootstrap_ci(samples, pctiles, n_boot=1000, ci=95, seed=None, n_jobs=1, 
+                 max_elements=int(1e7)):
+    """Percentile bootstrap confidence intervals for the mean, SD and
+    percentiles of each of several samples (e.g. the demographic bins of a
+    norm table).
+
+    Resampling is batched: for each sample, blocks of bootstrap index
+    matrices (resamples x N) are generated at once and the statistics are
+    computed with vectorized reductions over the resample axis. Blocks are
+    sized so that at most max_elements scores are resampled at a time.
+    Samples are processed in parallel threads; each sample gets its own
+    random stream spawned from seed, so results are reproducible and do
+    not depend on n_jobs.
+
+    Args
+    ----
+    samples (list): List of 1D arrays of scores.
+    pctiles (list): Percentiles (0-100) to compute CIs for.
+    n_boot (int, optional): Number of bootstrap resamples.
+    ci (float, optional): Confidence level (in percent).
+    seed (int or list of ints, optional): Seed for np.random.SeedSequence.
+    n_jobs (int, optional): Number of threads. None uses all CPUs.
+    max_elements (int, optional): Max number of resampled scores held in 
+        memory at once (per thread).
+
+    Returns
+    -------
+    cis (ndarray): Array of shape (n_samples, 2 + n_pctiles, 2) with the lower
+        and upper CI bounds of the mean, SD (ddof=0) and each percentile. 
+        Samples with no scores get NaN.
+    """
+
+    streams = np.random.SeedSequence(seed).spawn(len(samples))
+    alpha = 100 - ci
+
+    def run(args):
+        scores, stream = args
+        return _bootstrap_sample(np.asarray(scores, dtype=float), pctiles, n_boot,
+                                 alpha, np.random.default_rng(stream), max_elements)
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        cis = list(executor.map(run, zip(samples, streams)))
+    return np.array(cis).reshape(len(samples), 2 + len(pctiles), 2)
+
+
+def pairwise_corr(data, ci=None):
+    """Pairwise-complete Pearson correlations between the columns of data.
+    Each pair of columns uses all rows in which both are observed.
+
+    Rather than looping over column pairs, the per-pair counts, sums, sums of
+    squares and cross-products are obtained with a handful of matrix 
+    products of the (column-centered, zero-filled) data and its observation 
+    mask.
+
+    Args
+    ----
+    data (ndarray): 2D array (e.g. test runs x subtests) with NaN for missing
+        scores.
+    ci (float, optional): If provided, confidence level (in percent) of Fisher-z
+        confidence intervals for each correlation.
+
+    Returns
+    -------
+    r (ndarray): Correlation matrix. NaN where fewer than 2 rows are shared or
+        either column is constant over the shared rows.
+    n (ndarray): Number of shared observations for each pair of columns.
+    ci_lo, ci_hi (ndarray): Lower / upper CI bounds (None if ci is None). NaN where
+        n < 4.
+    """
+
+    data = np.asarray(data, dtype=float)
+    mask = ~np.isnan(data)
+    observed = mask.astype(float)
+    # Centering each column first avoids catastrophic cancellation below
+    col_means = np.nanmean(np.where(mask.any(axis=0), data, 0), axis=0)
+    z = np.where(mask, data - col_means, 0)
+    n = observed.T @ observed
+    sums = z.T @ observed  # sums[i, j]: sum of column i over rows where j is observed
+    sq_sums = (z * z).T @ observed
+    cross = z.T @ z
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = n * cross - sums * sums.T
+        var = n * sq_sums - sums ** 2
+        r = cov / np.sqrt(var * var.T)
+    r[(n < 2) | (var <= 0) | (var.T <= 0)] = np.nan
+    r = np.clip(r, -1, 1)
+    if ci is None:
+        return r, n.astype(int), None, None
+    z_crit = NormalDist().inv_cdf(1 - (1 - ci / 100) / 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fisher_z = np.arctanh(r)
+        se = 1 / np.sqrt(n - 3)
+    se[n < 4] = np.nan
+    ci_lo = np.tanh(fisher_z - z_crit * se)
+    ci_hi = np.tanh(fisher_z + z_crit * se)
+    return r, n.astype(int), ci_lo, ci_hi
+
+
+def _bootstrap_sample(scores, pctiles, n_boot, alpha, rng, max_elements):
+    n = len(scores)
+    if n == 0:
+        return np.full((2 + len(pctiles), 2), np.nan)
+    boot = np.empty((2 + len(pctiles), n_boot))
+    block = max(1, max_elements // n)
+    for start in range(0, n_boot, block):
+        stop = min(start + block, n_boot)
+        resamples = scores[rng.integers(0, n, size=(stop - start, n))]
+        boot[0, start:stop] = resamples.mean(axis=1)
+        boot[1, start:stop] = resamples.std(axis=1)
+        boot[2:, start:stop] = np.percentile(resamples, pctiles, axis=1, 
+                                             overwrite_input=True)
+    return np.percentile(boot, [alpha / 2, 100 - alpha / 2], axis=1).T
+
+
+def _weighted_median(vals, weights):
+    # Smallest value whose cumulative weight (in sorted order) reaches half
+    # of the total weight. Quickselect on partitions, so O(n) rather than a
+    # full argsort.
+    target = weights.sum() / 2
+    while len(vals) > 32:
+        m = len(vals) // 2
+        order = np.argpartition(vals, m)
+        vals, weights = vals[order], weights[order]
+        below = weights[:m].sum()
+        if below >= target:
+            vals, weights = vals[:m], weights[:m]
+        elif below + weights[m] >= target:
+            return vals[m]
+        else:
+            target -= below + weights[m]
+            vals, weights = vals[m + 1:], weights[m + 1:]
+    order = np.argsort(vals, kind='stable')
+    cum = np.cumsum(weights[order])
+    return vals[order][np.searchsorted(cum, target)]
+
+
+def _count_diffs(x, trial, strict):
+    # For each row i of sorted x, count the columns j > i with
+    # x_j - x_i < trial (strict) or <= trial. A single searchsorted gives
+    # the answer up to floating point rounding of x_i + trial; the few rows
+    # where that disagrees with the differences themselves are resolved
+    # with an exact vectorized binary search.
+    n = len(x)
+    rows = np.arange(n)
+    side = 'left' if strict else 'right'
+    pos = np.clip(np.searchsorted(x, x + trial, side=side), rows + 1, n)
+
+    def below(cols, r):
+        diff = x[np.minimum(cols, n - 1)] - x[r]
+        return (diff < trial) if strict else (diff <= trial)
+
+    ok = ((pos == rows + 1) | below(pos - 1, rows)) & ((pos == n) | ~below(pos, rows))
+    bad = np.flatnonzero(~ok)
+    if len(bad):
+        lo = bad + 1
+        hi = np.full(len(bad), n)
+        while np.any(lo < hi):
+            mid = (lo + hi) // 2
+            step = below(mid, bad) & (mid < hi)
+            lo = np.where(step, mid + 1, lo)
+            hi = np.where(step, hi, mid)
+        pos[bad] = lo
+    return pos - rows - 1
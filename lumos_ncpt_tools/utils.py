@@ -1,26 +1,283 @@
 import pkgutil
 import csv
 import io
+import os
 
 import pandas as pd
+import numpy as np
 
 
-def load_data(data_path, fn, chunksize=1e6, nrows='all', verbose=False, n_print=5):
+def load_data(data_path, fn, chunksize=1e6, nrows='all', verbose=False, n_print=5,
+              max_memory=None, spill_dir=None):
+    """Load a NCPT data file.
+    
+    If max_memory is provided, the data are loaded within a memory budget: the
+    bytes per row are estimated from a first chunk, the rest of the file is read
+    in chunks sized to fit the budget, each chunk is downcast (smallest lossless
+    numeric dtypes; strings become categoricals) and copied into preallocated 
+    columns, so the full dataset is never held twice. If the downcast data would 
+    not fit within max_memory, a MemoryError is raised before reading the rest 
+    of the file, unless spill_dir is provided, in which case the numeric columns
+    are written to memory-mapped .npy files in spill_dir. The budget covers the 
+    loaded columns plus the working memory of each chunk (parsed chunk, parser
+    buffers and downcasting temporaries, accounted as twice the parsed chunk)
+    and ~1 MB of fixed CSV reader buffers, so budgets below a few MB cannot be
+    met; the largest accounted total is stored in df.attrs['load_est_peak_bytes'].
+    
+    Args
+    ----
+    data_path (str): Directory containing the data file.
+    fn (str): Name of the data file.
+    chunksize (int, optional): Number of rows to read at a time (ignored if 
+        max_memory is provided).
+    nrows (int or 'all', optional): Number of rows to load.
+    verbose (bool, optional): Display info on the loaded data.
+    n_print (int, optional): Number of rows displayed if verbose.
+    max_memory (int or str, optional): Memory budget in bytes, or a string such
+        as '500MB' or '4GB'.
+    spill_dir (str, optional): Directory for memory-mapped columns if the data
+        do not fit within max_memory.
+        
+    Returns
+    -------
+    df (DataFrame): The loaded data.
+    """
+    
     load_str = data_path + '/' + fn
-    if nrows == 'all':
+    if max_memory is not None:
+        df = _load_budgeted(load_str, nrows, _parse_bytes(max_memory), spill_dir)
+    elif nrows == 'all':
         chunks = pd.read_csv(load_str, header=0, chunksize=chunksize)
+        df = pd.concat(chunks)
     else:
         chunks = pd.read_csv(load_str, header=0, chunksize=chunksize, nrows=nrows)
-    df = pd.concat(chunks)
+        df = pd.concat(chunks)
     
     if verbose:
         print(fn)
         print(df.info())
         print(df.head(n_print))
+        if 'load_est_peak_bytes' in df.attrs:
+            print(f'Estimated peak memory: {df.attrs["load_est_peak_bytes"] / 1e6:.1f} MB')
+    
+    return df
+
+
+def _parse_bytes(size):
+    if isinstance(size, str):
+        units = {'KB': 1e3, 'MB': 1e6, 'GB': 1e9, 'TB': 1e12, 'B': 1}
+        size = size.strip().upper()
+        for unit, factor in units.items():
+            if size.endswith(unit):
+                return int(float(size[:-len(unit)]) * factor)
+    return int(size)
+
+
+def _count_rows(load_str, block_size=2**24):
+    # Number of data rows (lines after the header), from a raw scan of the file
+    n_lines = 0
+    last = b'\n'
+    with open(load_str, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            n_lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        n_lines += 1
+    return max(n_lines - 1, 0)
+
+
+def _load_budgeted(load_str, nrows, budget, spill_dir, probe_rows=1000, min_chunk=100,
+                   work_factor=2, reader_bytes=2**20):
+    # work_factor: memory used while parsing / downcasting a chunk, relative to 
+    # the parsed chunk (measured with tracemalloc at ~1.5-1.7x). reader_bytes:
+    # fixed read / decode buffers of the CSV reader (measured at ~0.85 MB).
+    n_rows = _count_rows(load_str, block_size=int(min(2**24, max(2**12, budget // 16))))
+    if nrows != 'all':
+        n_rows = min(n_rows, int(nrows))
+    # Parsed rows take a few times the bytes of the raw lines; keep the first 
+    # (probe) chunk well within the budget
+    line_bytes = os.path.getsize(load_str) / (n_rows + 1)
+    probe_rows = int(min(probe_rows, max(min_chunk, (budget - reader_bytes) 
+                                         / (8 * work_factor * line_bytes))))
+    reader = pd.read_csv(load_str, header=0, iterator=True)
+    chunk = reader.get_chunk(max(min(probe_rows, n_rows), 1))[:n_rows]
+    raw_row_bytes = chunk.memory_usage(index=False, deep=True).sum() / max(len(chunk), 1)
+    store = _ColumnStore(n_rows, os.path.basename(load_str))
+    est_bytes = (reader_bytes + store.row_bytes(chunk) * n_rows 
+                 + work_factor * raw_row_bytes * len(chunk))
+    if spill_dir is None and est_bytes > budget:
+        raise MemoryError(f'{load_str}: estimated {est_bytes / 1e6:.3g} MB after downcasting '
+                          f'exceeds max_memory ({budget / 1e6:.3g} MB)')
+    # Leave headroom for columns that have to be upcast by later chunks
+    store.allocate(chunk, spill_dir if est_bytes > budget / 2 else None)
     
+    peak = 0
+    while True:
+        chunk_bytes = chunk.memory_usage(index=False, deep=True).sum()
+        peak = max(peak, reader_bytes + store.nbytes + work_factor * chunk_bytes)
+        if peak > budget:
+            raise MemoryError(f'{load_str}: exceeded max_memory ({budget / 1e6:.3g} MB)')
+        store.add(chunk)
+        del chunk
+        n_left = n_rows - store.n_filled
+        if n_left <= 0:
+            break
+        # Size the next chunk to use at most 3/4 of the remaining budget (rows
+        # can be larger than in the previous chunks)
+        raw_row_bytes = max(raw_row_bytes, chunk_bytes / max(store.last_len, 1))
+        free = budget - reader_bytes - store.nbytes
+        chunk_rows = int(min(n_left, max(min_chunk, 0.75 * free / (work_factor * raw_row_bytes))))
+        try:
+            chunk = reader.get_chunk(chunk_rows)
+        except StopIteration:
+            break
+    reader.close()
+    df = store.to_frame()
+    df.attrs['load_est_peak_bytes'] = int(peak)
     return df
 
 
+class _ColumnStore:
+    # Preallocated, downcast columns filled chunk by chunk. Numeric columns are
+    # upcast in place if a later chunk needs a wider dtype; string columns are
+    # stored as categorical codes.
+    
+    def __init__(self, n_rows, name):
+        self.n_rows = n_rows
+        self.name = name
+        self.n_filled = 0
+        self.last_len = 0
+        self.cols = {}
+        self.categories = {}
+        self.spill_dir = None
+    
+    def row_bytes(self, chunk):
+        n_bytes = 0
+        for col in chunk.columns:
+            vals = self._downcast(chunk[col])
+            n_bytes += vals.dtype.itemsize if vals.dtype != object else 2
+        return n_bytes
+    
+    def allocate(self, chunk, spill_dir):
+        self.spill_dir = spill_dir
+        for col in chunk.columns:
+            vals = self._downcast(chunk[col])
+            if vals.dtype == object:
+                self.categories[col] = pd.Index([], dtype=object)
+                self.cols[col] = np.full(self.n_rows, -1, dtype=np.int8)
+            else:
+                self.cols[col] = self._empty(col, vals.dtype, self.n_rows)
+    
+    @property
+    def nbytes(self):
+        # Memory held in RAM (memory-mapped columns are not counted)
+        return sum(arr.nbytes for arr in self.cols.values() if not isinstance(arr, np.memmap))
+    
+    def add(self, chunk):
+        lo, hi = self.n_filled, self.n_filled + len(chunk)
+        if hi > self.n_rows:
+            self._grow(hi)
+        for col in chunk.columns:
+            if col in self.categories:
+                cats = self.categories[col]
+                uniques = pd.unique(chunk[col].dropna())
+                cats = cats.append(pd.Index(uniques).difference(cats))
+                self.categories[col] = cats
+                codes = cats.get_indexer(chunk[col])
+                self._fit(col, np.min_scalar_type(-len(cats)))
+                self.cols[col][lo:hi] = codes
+            else:
+                vals = self._downcast(chunk[col])
+                self._fit(col, vals.dtype)
+                self.cols[col][lo:hi] = vals
+        self.n_filled = hi
+        self.last_len = len(chunk)
+    
+    def to_frame(self):
+        data = {}
+        for col, arr in self.cols.items():
+            arr = arr[:self.n_filled]
+            if col in self.categories:
+                data[col] = pd.Categorical.from_codes(arr, self.categories[col])
+            else:
+                data[col] = arr
+        # copy=False keeps each preallocated column as its own block (no copy)
+        return pd.DataFrame(data, copy=False)
+    
+    def _fit(self, col, dtype):
+        arr = self.cols[col]
+        new_dtype = np.promote_types(arr.dtype, dtype)
+        if new_dtype != arr.dtype:
+            new_arr = self._empty(col, new_dtype, len(arr))
+            new_arr[:] = arr
+            self.cols[col] = new_arr
+            if isinstance(arr, np.memmap):
+                filename = arr.filename
+                del arr
+                os.remove(filename)
+    
+    def _grow(self, n_rows):
+        # Only needed if the raw line count underestimated the number of rows
+        for col, arr in self.cols.items():
+            new_arr = self._empty(col, arr.dtype, n_rows)
+            new_arr[:len(arr)] = arr
+            self.cols[col] = new_arr
+        self.n_rows = n_rows
+    
+    def _empty(self, col, dtype, n_rows):
+        if self.spill_dir is None:
+            return np.zeros(n_rows, dtype=dtype)
+        path = os.path.join(self.spill_dir, f'{self.name}.{col}.{np.dtype(dtype).name}.npy')
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(n_rows,))
+        
+    def _downcast(self, series):
+        if series.dtype == object or series.dtype.name == 'category':
+            return series.to_numpy(dtype=object)
+        vals = series.to_numpy()
+        if vals.dtype.kind == 'f':
+            if len(vals) and not np.isnan(vals).any() and np.array_equal(vals, np.round(vals)):
+                return pd.to_numeric(series, downcast='integer').to_numpy()
+            as_float32 = vals.astype(np.float32)
+            if np.array_equal(as_float32, vals, equal_nan=True):
+                return as_float32
+            return vals
+        if vals.dtype.kind in 'iu':
+            return pd.to_numeric(series, downcast='integer').to_numpy()
+        return vals
+
+
+def iter_chunks(data_path, fn, chunksize=1e6, usecols=None, dtype=None):
+    """Return an iterator over DataFrame chunks of a data file, for processing
+    datasets that are too large to load at once."""
+    load_str = data_path + '/' + fn
+    return pd.read_csv(load_str, header=0, chunksize=int(chunksize), usecols=usecols,
+                       dtype=dtype)
+
+
+def iter_run_chunks(chunks):
+    """Regroup an iterator of DataFrame chunks so that every chunk only contains
+    complete test runs (rows of a test run that straddle a chunk boundary are
+    carried over to the next chunk). Assumes that the rows of each test run are
+    contiguous, as in the NCPT data files."""
+    carry = None
+    for chunk in chunks:
+        if carry is not None and len(carry):
+            chunk = pd.concat([carry, chunk])
+        run_ids = chunk['test_run_id'].to_numpy()
+        if len(run_ids) == 0:
+            continue
+        other = np.flatnonzero(run_ids != run_ids[-1])
+        split = other[-1] + 1 if len(other) else 0
+        carry = chunk.iloc[split:]
+        if split > 0:
+            yield chunk.iloc[:split]
+    if carry is not None and len(carry):
+        yield carry
+
+
 def load_test_data():
     data_path = '../tests/test_df.csv'
     df = pd.read_csv(io.StringIO(
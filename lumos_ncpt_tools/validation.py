@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+from .utils import iter_run_chunks
+
+
+class ValidationReport:
+    """Result of validating a NCPT dataset: for each rule, the positions of the
+    rows that violate it.
+
+    Attributes
+    ----------
+    n_rows (int): Number of rows validated.
+    rows (dict): Maps each rule name to a sorted array of the (0-based) positions
+        of the violating rows.
+    """
+
+    def __init__(self, rules, n_rows=0):
+        self.n_rows = n_rows
+        self.rows = {rule: np.array([], dtype=np.int64) for rule in rules}
+
+    @property
+    def counts(self):
+        """Series with the number of violating rows for each rule."""
+        return pd.Series({rule: len(rows) for rule, rows in self.rows.items()}, name='n_rows')
+
+    @property
+    def ok(self):
+        return all(len(rows) == 0 for rows in self.rows.values())
+
+    def mask(self, rule):
+        """Return a boolean mask of the rows violating a rule."""
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.rows[rule]] = True
+        return mask
+
+    def summary(self):
+        """Display the number of violating rows for each rule."""
+        print('Validation report')
+        print('-----------------')
+        print(f'N rows: {self.n_rows}')
+        for rule, count in self.counts.items():
+            print(f'{rule}: {count}')
+        print('')
+
+    def _add(self, chunk_rows, n_rows):
+        for rule, rows in chunk_rows.items():
+            self.rows[rule] = np.concatenate([self.rows[rule], rows + self.n_rows])
+        self.n_rows += n_rows
+
+
+class Validator:
+    """Vectorized checks of NCPT data against the config. The config is compiled
+    into lookup arrays (battery x subtest membership, known batteries / subtests /
+    education levels) so each rule is a single array operation over a chunk.
+
+    Rules
+    -----
+    unknown_battery: battery_id is not in the config.
+    unknown_subtest: specific_subtest_id is not in the config.
+    subtest_not_in_battery: the subtest is not part of the row's battery.
+    duplicate_subtest: the (test_run_id, specific_subtest_id) pair occurs more than once.
+    inconsistent_run: the battery, user, demographics or grand index differ between
+        rows of the same test run (all rows of the run are flagged).
+    age_out_of_range: age is outside age_range (missing ages are allowed).
+    invalid_education: education_level is not in the config (missing levels are allowed).
+
+    Args
+    ----
+    config (dict): NCPT config (see NCPT.config).
+    """
+
+    rules = ['unknown_battery', 'unknown_subtest', 'subtest_not_in_battery',
+             'duplicate_subtest', 'inconsistent_run', 'age_out_of_range',
+             'invalid_education']
+    run_cols = ['user_id', 'battery_id', 'age', 'gender', 'education_level', 'grand_index']
+    age_range = (18, 99)
+
+    def __init__(self, config):
+        batteries = config['batteries']
+        subtests = config['subtests']
+        n_bat = max(batteries) + 1
+        n_sub = max(max(subtests), max(s for b in batteries.values() for s in b[1])) + 1
+        self.known_battery = np.zeros(n_bat, dtype=bool)
+        self.known_battery[list(batteries)] = True
+        self.known_subtest = np.zeros(n_sub, dtype=bool)
+        self.known_subtest[list(subtests)] = True
+        self.membership = np.zeros((n_bat, n_sub), dtype=bool)
+        for bat_id, (_, bat_subtests) in batteries.items():
+            self.membership[bat_id, bat_subtests] = True
+        self.known_education = np.zeros(max(config['education']) + 1, dtype=bool)
+        self.known_education[list(config['education'])] = True
+
+    def validate(self, df):
+        """Validate a DataFrame, return a ValidationReport."""
+        report = ValidationReport(self.rules)
+        report._add(self.check(df), len(df))
+        return report
+
+    def validate_chunks(self, chunks):
+        """Validate an iterable of DataFrame chunks (e.g. from utils.iter_chunks) in a
+        single streaming pass, return a ValidationReport. Row positions in the report
+        are relative to the start of the first chunk. The rows of each test run are
+        assumed to be contiguous (so runs can be regrouped into whole-run chunks).
+        """
+        report = ValidationReport(self.rules)
+        for chunk in iter_run_chunks(chunks):
+            report._add(self.check(chunk), len(chunk))
+        return report
+
+    def check(self, df):
+        """Return a dict mapping each rule to the positions of the violating rows of df."""
+        bat, bat_ok = self._lookup_index(df['battery_id'], self.known_battery)
+        sub, sub_ok = self._lookup_index(df['specific_subtest_id'], self.known_subtest)
+        in_battery = self.membership[bat, sub] & bat_ok & sub_ok
+        checks = {'unknown_battery': ~bat_ok,
+                  'unknown_subtest': ~sub_ok,
+                  'subtest_not_in_battery': bat_ok & sub_ok & ~in_battery,
+                  'duplicate_subtest': df.duplicated(
+                      subset=['test_run_id', 'specific_subtest_id'], keep=False).to_numpy(),
+                  'inconsistent_run': self._inconsistent_runs(df)}
+        age = df['age'].to_numpy(dtype=float)
+        checks['age_out_of_range'] = (age < self.age_range[0]) | (age > self.age_range[1])
+        edu = df['education_level']
+        _, edu_ok = self._lookup_index(edu, self.known_education)
+        checks['invalid_education'] = ~edu_ok & edu.notna().to_numpy()
+        return {rule: np.flatnonzero(checks[rule]) for rule in self.rules}
+
+    def _lookup_index(self, col, lookup):
+        # Integer index into a lookup array; invalid / out-of-range values map to 0
+        # and are flagged as not ok.
+        vals = col.to_numpy(dtype=float)
+        valid = np.isfinite(vals) & (vals >= 0) & (vals < len(lookup)) & (vals == np.round(vals))
+        idx = np.where(valid, vals, 0).astype(np.int64)
+        return idx, valid & lookup[idx]
+
+    def _inconsistent_runs(self, df):
+        # Compare every row to the first row of its test run
+        run_codes, run_ids = pd.factorize(df['test_run_id'])
+        # Rows with a missing test run ID are grouped together
+        run_codes = np.where(run_codes < 0, len(run_ids), run_codes)
+        _, first_rows = np.unique(run_codes, return_index=True)
+        first = first_rows[run_codes]
+        bad_runs = np.zeros(len(run_ids) + 1, dtype=bool)
+        for col in self.run_cols:
+            if col not in df.columns:
+                continue
+            vals = df[col].to_numpy()
+            first_vals = vals[first]
+            same = (vals == first_vals) | (pd.isna(vals) & pd.isna(first_vals))
+            bad_runs[run_codes[~same]] = True
+        return bad_runs[run_codes]
@@ -0,0 +1,255 @@
+import os
+import json
+import hashlib
+import bz2
+import gzip
+import lzma
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+# Supported formats, by file extension
+csv_openers = {'.csv': open, '.csv.gz': gzip.open, '.csv.bz2': bz2.open, '.csv.xz': lzma.open}
+arrow_formats = {'.parquet', '.feather'}
+formats = list(csv_openers) + sorted(arrow_formats)
+default_compression = {'.csv.gz': 1, '.csv.bz2': 1, '.csv.xz': 1,
+                       '.parquet': 'zstd', '.feather': 'lz4'}
+# Directory name of missing partition values (as in Hive / pyarrow)
+null_partition = '__HIVE_DEFAULT_PARTITION__'
+
+
+def write_df(df, save_path, fmt=None, mask=None, partition_by=None, n_jobs=1,
+             chunksize=1e6, compression=None, manifest=True):
+    """Write a DataFrame as (compressed) CSV, Parquet or Feather, streaming it in
+    chunks so that the output (including a filtered subset selected with mask)
+    is never copied in full.
+
+    If partition_by is provided, save_path is a directory and one file is written
+    per partition (e.g. per battery and subtest), in parallel, in a Hive layout:
+    save_path/battery_id=17/specific_subtest_id=29/part-0.parquet. As in Hive, 
+    the partition columns are stored in the directory names only (not in the 
+    files), so the output can be read with e.g. pd.read_parquet(save_path); see
+    also read_part.
+
+    A small JSON manifest with the row counts, file sizes, column dtypes and a
+    schema hash is written alongside the data (save_path + '.manifest.json', or
+    save_path/_manifest.json if partitioned) so downstream loaders can quickly
+    validate the output (see check_manifest).
+
+    Parquet and Feather output requires pyarrow.
+
+    Args
+    ----
+    df (DataFrame): Data to write.
+    save_path (str): Output file, or output directory if partition_by is provided.
+    fmt (str, optional): One of '.csv', '.csv.gz', '.csv.bz2', '.csv.xz', '.parquet',
+        '.feather'. If set to None (the default), it is inferred from save_path.
+    mask (array-like, optional): Boolean mask of the rows of df to write.
+    partition_by (str or list, optional): Column(s) to partition the output by.
+    n_jobs (int, optional): Number of partitions written in parallel (threads).
+    chunksize (int, optional): Number of rows written at a time.
+    compression (optional): Compression level (CSV) or codec (Parquet/Feather). If set
+        to None (the default), a fast setting is used: level 1 for gzip, bz2 and xz
+        (bz2 and xz are still much slower than the other formats), zstd (Parquet)
+        or lz4 (Feather).
+    manifest (bool, optional): Write the manifest.
+
+    Returns
+    -------
+    manifest (dict): Manifest describing the output.
+    """
+
+    fmt = _infer_format(save_path) if fmt is None else fmt
+    assert fmt in formats, f'Format not supported! Supported formats: {formats}'
+    compression = default_compression.get(fmt) if compression is None else compression
+    positions = np.arange(len(df)) if mask is None else np.flatnonzero(mask)
+
+    if partition_by is None:
+        parts = {save_path: positions}
+        manifest_path = save_path + '.manifest.json'
+        base_dir = os.path.dirname(save_path)
+    else:
+        partition_by = [partition_by] if isinstance(partition_by, str) else list(partition_by)
+        groups = df[partition_by].iloc[positions].groupby(
+            partition_by, sort=True, dropna=False).indices
+        parts = {}
+        for key, group_pos in groups.items():
+            key = key if isinstance(key, tuple) else (key,)
+            dirs = [f'{col}={null_partition if pd.isna(val) else val}'
+                    for col, val in zip(partition_by, key)]
+            parts[os.path.join(save_path, *dirs, 'part-0' + fmt)] = positions[group_pos]
+        manifest_path = os.path.join(save_path, '_manifest.json')
+        base_dir = save_path
+    file_cols = [col for col in df.columns if col not in (partition_by or [])]
+
+    schema = _arrow_schema(df, file_cols) if fmt in arrow_formats else None
+
+    col_pos = [df.columns.get_loc(col) for col in file_cols]
+
+    def write_part(item):
+        path, part_pos = item
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        chunks = (df.iloc[part_pos[start:start + int(chunksize)], col_pos]
+                  for start in range(0, max(len(part_pos), 1), int(chunksize)))
+        if fmt in arrow_formats:
+            _write_arrow(chunks, path, fmt, schema, compression)
+        else:
+            _write_csv(chunks, path, fmt, compression)
+        return {'path': os.path.relpath(path, base_dir or '.'), 'n_rows': len(part_pos),
+                'n_bytes': os.path.getsize(path)}
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        files = list(executor.map(write_part, parts.items()))
+
+    out_manifest = {'format': fmt,
+                    'n_rows': int(sum(f['n_rows'] for f in files)),
+                    'columns': {col: str(dtype) for col, dtype in df.dtypes.items()},
+                    'schema_hash': schema_hash(df),
+                    'partition_by': partition_by,
+                    'files': files}
+    if manifest:
+        with open(manifest_path, 'w') as f:
+            json.dump(out_manifest, f, indent=1)
+    return out_manifest
+
+
+def schema_hash(df):
+    """Return a hash of the column names and dtypes of a DataFrame."""
+    schema_str = ';'.join(f'{col}:{dtype}' for col, dtype in df.dtypes.items())
+    return hashlib.sha256(schema_str.encode('utf-8')).hexdigest()
+
+
+def read_manifest(save_path):
+    """Read the manifest written by write_df for save_path (file or partition directory)."""
+    if os.path.isdir(save_path):
+        manifest_path = os.path.join(save_path, '_manifest.json')
+    else:
+        manifest_path = save_path + '.manifest.json'
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def partition_values(rel_path):
+    """Return the partition values encoded in the path of a partition file
+    (relative to the partition directory) as a dict of strings, e.g.
+    {'battery_id': '17', 'specific_subtest_id': '29'}; missing values are None."""
+    dirs = rel_path.replace('\\', '/').split('/')[:-1]
+    values = dict(d.split('=', 1) for d in dirs)
+    return {col: None if val == null_partition else val for col, val in values.items()}
+
+
+def read_part(save_path, file_info, columns=None, manifest=None):
+    """Read one file of a partitioned output written by write_df, restoring the
+    partition columns from its path (with the dtypes recorded in the manifest).
+
+    Args
+    ----
+    save_path (str): Partition directory passed to write_df.
+    file_info (dict): Entry of manifest['files'] for the file.
+    columns (list, optional): Columns to read (default: all).
+    manifest (dict, optional): Manifest of save_path, if already read.
+
+    Returns
+    -------
+    part_df (DataFrame): Data of the partition.
+    """
+
+    manifest = read_manifest(save_path) if manifest is None else manifest
+    path = os.path.join(save_path, file_info['path'])
+    values = partition_values(file_info['path'])
+    file_cols = None if columns is None else [col for col in columns if col not in values]
+    if path.endswith('.parquet'):
+        part_df = pd.read_parquet(path, columns=file_cols)
+    elif path.endswith('.feather'):
+        part_df = pd.read_feather(path, columns=file_cols)
+    else:
+        part_df = pd.read_csv(path, usecols=file_cols)
+    for col, val in values.items():
+        if columns is None or col in columns:
+            dtype = manifest['columns'].get(col, 'object')
+            part_df[col] = pd.Series(val, index=part_df.index, dtype=object).astype(dtype)
+    order = list(manifest['columns']) if columns is None else columns
+    return part_df[[col for col in order if col in part_df.columns]]
+
+
+def check_manifest(save_path, columns=None):
+    """Quickly check output written by write_df against its manifest: all files
+    exist with the recorded sizes, and (optionally) the expected columns/dtypes
+    match the recorded schema. Does not read the data.
+
+    Args
+    ----
+    save_path (str): Path passed to write_df.
+    columns (DataFrame or dict, optional): Expected schema, either an (empty) DataFrame
+        with the expected columns/dtypes, or a dict mapping column names to dtype strings.
+
+    Returns
+    -------
+    ok (bool): True if the output matches the manifest.
+    """
+
+    manifest = read_manifest(save_path)
+    base_dir = save_path if os.path.isdir(save_path) else os.path.dirname(save_path)
+    for f in manifest['files']:
+        path = os.path.join(base_dir, f['path'])
+        if not os.path.exists(path) or os.path.getsize(path) != f['n_bytes']:
+            return False
+    if columns is not None:
+        if isinstance(columns, pd.DataFrame):
+            return schema_hash(columns) == manifest['schema_hash']
+        return {col: str(dtype) for col, dtype in columns.items()} == manifest['columns']
+    return True
+
+
+def _infer_format(save_path):
+    for fmt in sorted(formats, key=len, reverse=True):
+        if save_path.endswith(fmt):
+            return fmt
+    raise ValueError(f'Could not infer the output format of {save_path}; supported formats: {formats}')
+
+
+def _write_csv(chunks, path, fmt, compression):
+    if fmt == '.csv':
+        kwargs = {}
+    elif fmt == '.csv.xz':
+        kwargs = {'preset': compression}
+    else:
+        kwargs = {'compresslevel': compression}
+    with csv_openers[fmt](path, 'wt', newline='', **kwargs) as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, sep=',', index=False, header=(i == 0))
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+    except ImportError:
+        raise ImportError('pyarrow is required to write Parquet/Feather files (pip install pyarrow)')
+    return pyarrow
+
+
+def _arrow_schema(df, columns, n_infer=10000):
+    pa = _import_pyarrow()
+    schema = pa.Schema.from_pandas(df.iloc[:n_infer][columns], preserve_index=False)
+    # Object columns that are all missing in the first rows are assumed to be strings
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, pa.field(field.name, pa.string()))
+    return schema
+
+
+def _write_arrow(chunks, path, fmt, schema, compression):
+    pa = _import_pyarrow()
+    if fmt == '.parquet':
+        writer = pa.parquet.ParquetWriter(path, schema, compression=compression)
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        writer = pa.ipc.new_file(path, schema, options=options)
+    with writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
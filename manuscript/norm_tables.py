@@ -9,6 +9,8 @@ import numpy as np
 import pandas as pd
 
 from lumos_ncpt_tools.utils import load_data
+from lumos_ncpt_tools.stats import bootstrap_ci
+from lumos_ncpt_tools.writers import write_df
 
 class NormTables():
     config_path = '../lumos_ncpt_tools/config/ncpt_config.yaml'
@@ -16,13 +18,24 @@ class NormTables():
     edu_bins = [[1, 2], [3, 4, 8], [5, 6, 7]] 
     genders = ['m', 'f']
     pctiles = [10, 25, 50, 75, 90]
-    cols = ['subtest_name', 'specific_subtest_id', 'age', 'education_level', 'gender', 'N', 
-            'mean', 'SD', '10th_perc', '25th_perc', '50th_perc', '75th_perc', '90th_perc']
+    stat_cols = ['mean', 'SD', '10th_perc', '25th_perc', '50th_perc', '75th_perc', '90th_perc']
+    cols = ['subtest_name', 'specific_subtest_id', 'age', 'education_level', 'gender', 'N'] + stat_cols
     batteries = [17, 32, 39, 50, 60]
     subtests_to_invert = [26, 32, 39, 40]
     
-    def __init__(self, data_dir, save_dir):
+    def __init__(self, data_dir, save_dir, n_boot=1000, ci=95, seed=0, n_jobs=None, fmt='.csv'):
+        # Bootstrap confidence intervals (set n_boot to 0 to skip). 
+        # n_jobs: number of threads used to bootstrap the bins in parallel.
+        # fmt: output format of the tables (see writers.write_df)
         self.data_dir = data_dir
+        self.fmt = fmt
+        self.n_boot = n_boot
+        self.ci = ci
+        self.seed = seed
+        self.n_jobs = n_jobs
+        if n_boot > 0:
+            ci_cols = [f'{stat}_ci_{bound}' for stat in self.stat_cols for bound in ['lo', 'hi']]
+            self.cols = self.cols + ci_cols
         self.save_dir = os.path.join(save_dir, 'demog_norm_tables')
         if not os.path.exists(self.save_dir):
             os.makedirs(self.save_dir)
@@ -32,8 +45,8 @@ class NormTables():
         for bat_id in self.batteries:
             bat_data = self._get_battery_data(bat_id)
             bat_df = pd.DataFrame(data=bat_data, columns=self.cols)
-            save_path = os.path.join(self.save_dir, f'battery{bat_id}_norms.csv')
-            bat_df.to_csv(save_path, sep=',', index=False)
+            save_path = os.path.join(self.save_dir, f'battery{bat_id}_norms{self.fmt}')
+            write_df(bat_df, save_path)
     
     def _get_battery_data(self, bat_id):
         bat_data = []
@@ -43,37 +56,59 @@ class NormTables():
         bat_min = float('inf')
         for sub in subtests:
             sub_df = bat_df.query('specific_subtest_id == @sub')
-            subtest_data, bat_min = self._get_subtest_data(sub_df, sub, bat_min)
+            subtest_data, bat_min = self._get_subtest_data(sub_df, sub, bat_min, bat_id)
             bat_data.extend(subtest_data)
         print(f'Battery {bat_id} bin min N: {bat_min}')
-        bat_data.extend(self._get_GI_data(bat_df))
+        bat_data.extend(self._get_GI_data(bat_df, bat_id))
         return bat_data
 
-    def _get_GI_data(self, df):
+    def _get_GI_data(self, df, bat_id):
         GI_data = []
+        bin_scores = []
         GI_vec = ['Grand Index', 'NA']
         df = df.drop_duplicates(subset=['test_run_id'])
         df = df.dropna(subset=['grand_index', 'gender', 'education_level', 'age'])
         for dbin in product(self.age_bins, self.edu_bins, self.genders):
             bin_data = copy.copy(GI_vec)
-            this_bin_data, _ = self._get_bin_data(df, dbin, 'grand_index', 0)
+            this_bin_data, _, scores = self._get_bin_data(df, dbin, 'grand_index', 0)
             bin_data.extend(this_bin_data)
             GI_data.append(bin_data)
+            bin_scores.append(scores)
+        self._add_bin_cis(GI_data, bin_scores, 'grand_index', bat_id)
         return GI_data
 
-    def _get_subtest_data(self, df, sub_id, bat_min):
+    def _get_subtest_data(self, df, sub_id, bat_min, bat_id):
         subtest_data = []
+        bin_scores = []
         n_pre = len(df)
         df_filt = df.dropna(subset=['raw_score', 'gender', 'education_level', 'age'])
         sub_name = self.config['subtests'][sub_id][0]
         bin_vec = [sub_name, sub_id]
         for dbin in product(self.age_bins, self.edu_bins, self.genders):
             bin_data = copy.copy(bin_vec)
-            this_bin_data, bat_min = self._get_bin_data(df_filt, dbin, sub_id, bat_min)
+            this_bin_data, bat_min, scores = self._get_bin_data(df_filt, dbin, sub_id, bat_min)
             bin_data.extend(this_bin_data)
             subtest_data.append(bin_data)
+            bin_scores.append(scores)
+        self._add_bin_cis(subtest_data, bin_scores, sub_id, bat_id)
         return subtest_data, bat_min
 
+    def _add_bin_cis(self, data, bin_scores, sub_id, bat_id):
+        # Bootstrap all bins of a subtest together (in parallel); each
+        # battery/subtest gets its own reproducible random streams.
+        if self.n_boot == 0:
+            return
+        if sub_id in self.subtests_to_invert:
+            pctiles = [100-p for p in self.pctiles]
+        else:
+            pctiles = self.pctiles
+        sub_key = 0 if sub_id == 'grand_index' else sub_id
+        cis = bootstrap_ci(bin_scores, pctiles, n_boot=self.n_boot, ci=self.ci, 
+                           seed=[self.seed, bat_id, sub_key], n_jobs=self.n_jobs)
+        for bin_data, bin_cis in zip(data, cis):
+            bin_data.extend(np.round(bin_cis[:2].ravel(), 2))
+            bin_data.extend([int(val) for val in bin_cis[2:].ravel()])
+
     def _get_bin_data(self, df, dbin, sub_id, bat_min):
         bin_data = []
         age, edu, gen = dbin[0], dbin[1], dbin[2]
@@ -94,15 +129,18 @@ class NormTables():
         bin_data.append(N)
         if N < bat_min:
             bat_min = N
-        bin_data.extend(self._get_bin_stats(bin_df, sub_id))
-        return bin_data, bat_min
+        scores = self._get_bin_scores(bin_df, sub_id)
+        bin_data.extend(self._get_bin_stats(scores, sub_id))
+        return bin_data, bat_min, scores
 
-    def _get_bin_stats(self, df, sub_id):
-        stats = []
+    def _get_bin_scores(self, df, sub_id):
         if sub_id == 'grand_index':
-            scores = df['grand_index'].values
+            return df['grand_index'].values
         else:
-            scores = df['raw_score'].values
+            return df['raw_score'].values
+
+    def _get_bin_stats(self, scores, sub_id):
+        stats = []
         stats.append(np.round(np.mean(scores), 2))
         stats.append(np.round(np.std(scores), 2))
         for p in self.pctiles:
@@ -6,7 +6,6 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
-import statsmodels.formula.api as smf
 
 from lumos_ncpt_tools.ncpt import NCPT
 from lumos_ncpt_tools.utils import load_data
@@ -14,14 +13,17 @@ from lumos_ncpt_tools.utils import load_data
 class Figure1():
     """Subtest score correlation matrices for each battery."""
     # Only users who completed the entire test battery
-    # are included in the correlation analyses.
+    # are included in the correlation analyses (unless pairwise_complete
+    # is set, in which case each correlation uses all test runs in which 
+    # both subtests were completed).
     # Education, age, and gender are regressed out from the
     # raw scores prior to computing correlations. 
     
     config_path = '../lumos_ncpt_tools/config/ncpt_config.yaml'
     
-    def __init__(self, data_dir, save_dir, figsize):
+    def __init__(self, data_dir, save_dir, figsize, pairwise_complete=False):
         self.data_dir = data_dir
+        self.pairwise_complete = pairwise_complete
         self.png_path = os.path.join(save_dir, 'figure1.png')
         self.svg_path = os.path.join(save_dir, 'figure1.svg')        
         self.config = yaml.safe_load(pkgutil.get_data('lumos_ncpt_tools', self.config_path))
@@ -40,8 +42,6 @@ class Figure1():
                               39: [29, 30, 28, 33, 31, 38, 39, 40],
                               50: [29, 30, 43, 44, 31, 45, 39, 40],
                               60: [55, 51, 54, 53, 52]}
-        # Define regression model 
-        self.model = 'raw_score ~ age + C(education_level) + C(gender)'
        
     def make_figure(self):
         fig = plt.figure(constrained_layout=False, figsize=self.figsize)
@@ -79,24 +79,35 @@ class Figure1():
         bat_df = load_data(self.data_dir, data_fn) 
         bat_ncpt = NCPT(bat_df)
         del bat_df
-        filt_df, _ = bat_ncpt.filter_by_completeness()        
+        if self.pairwise_complete:
+            filt_df = bat_ncpt.df
+        else:
+            filt_df, _ = bat_ncpt.filter_by_completeness()        
         filt_df = filt_df.dropna(subset=['gender', 'education_level', 'age'])
+        # Regress raw_score ~ age + C(education_level) + C(gender) for each subtest
+        filt_ncpt = NCPT(filt_df)
+        filt_ncpt.fit_demog_adjustment()
+        adj_df = filt_ncpt.adjust_scores()
         subtests = self.subtest_order[bat_id]
-        scores = {}
+        names = [self.config['subtests'][sub][1] for sub in subtests]
         
-        for sub in subtests:
-            name = self.config['subtests'][sub][1]
-            sub_df = filt_df.query('specific_subtest_id == @sub').copy()
-            if sub in self.subtests_to_invert:
-                sub_df.loc[:, 'raw_score'] = -1 * sub_df['raw_score']
-            sub_model = smf.ols(formula=self.model, data=sub_df)
-            results = sub_model.fit()
-            predictions = results.predict(sub_df)
-            residuals = sub_df['raw_score'] - predictions
-            scores[name] = residuals.values
-
-        score_df = pd.DataFrame(scores)
-        corrs = score_df.corr(method='pearson')      
+        if self.pairwise_complete:
+            invert = adj_df['specific_subtest_id'].isin(self.subtests_to_invert)
+            adj_df.loc[invert, 'adjusted_score'] *= -1
+            # Duplicated subtests are ignored, as the completeness filter excludes them
+            corrs, n_obs, _, _ = filt_ncpt.pairwise_correlations(
+                score_col='adjusted_score', subtests=subtests, df=adj_df, duplicates='drop')
+            corrs.index, corrs.columns = names, names
+            print(f'Min N: {n_obs.values.min()}, max N: {n_obs.values.max()}')
+        else:
+            scores = {}
+            for sub, name in zip(subtests, names):
+                residuals = adj_df.query('specific_subtest_id == @sub')['adjusted_score']
+                if sub in self.subtests_to_invert:
+                    residuals = -1 * residuals
+                scores[name] = residuals.values
+            score_df = pd.DataFrame(scores)
+            corrs = score_df.corr(method='pearson')      
         np.fill_diagonal(corrs.values, np.nan)
         
         min_r = corrs.min().min()
@@ -0,0 +1,56 @@
+# Test AdjustmentMixin
+import os
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from lumos_ncpt_tools.ncpt import NCPT
+
+
+demo_path = os.path.join(os.path.dirname(__file__), '..', 'demo_data.csv')
+
+
+def load_demo_variants():
+    df = pd.read_csv(demo_path)
+    # Gender code not in the demo data, integer education codes
+    other_df = df.copy()
+    rng = np.random.default_rng(0)
+    other_df.loc[rng.random(len(df)) < 0.05, 'gender'] = 'o'
+    other_df = other_df.dropna(subset=['education_level'])
+    other_df['education_level'] = other_df['education_level'].astype(int)
+    return [df, other_df]
+
+
+@pytest.mark.parametrize('variant', [0, 1])
+def test_adjustment_matches_statsmodels(variant):
+    smf = pytest.importorskip('statsmodels.formula.api')
+    model = 'raw_score ~ age + C(education_level) + C(gender)'
+    df = load_demo_variants()[variant]
+    ncpt = NCPT(df)
+    
+    # Small chunks to exercise the accumulation of the sufficient statistics
+    coefs = ncpt.fit_demog_adjustment(chunksize=5000)
+    adj_df = ncpt.adjust_scores(chunksize=5000)
+    assert len(adj_df) == len(df)
+    
+    for sub in df['specific_subtest_id'].unique():
+        sub_df = df.query('specific_subtest_id == @sub')
+        results = smf.ols(formula=model, data=sub_df).fit()
+        sm_resid = sub_df['raw_score'] - results.predict(sub_df)
+        adjusted = adj_df.loc[sub_df.index, 'adjusted_score']
+        assert np.allclose(adjusted, sm_resid, equal_nan=True)
+        sub_coefs = coefs.loc[sub].dropna()
+        assert set(sub_coefs.index) == set(results.params.index)
+        assert np.allclose(sub_coefs, results.params[sub_coefs.index])
+
+
+def test_adjustment_unseen_levels():
+    df = pd.read_csv(demo_path)
+    ncpt = NCPT(df)
+    ncpt.fit_demog_adjustment()
+    assert ncpt.adjustment_genders == ['f', 'm']
+    new_df = df.copy()
+    new_df['gender'] = 'o'
+    adj_df = pd.concat(ncpt.iter_adjusted_scores(chunks=[new_df]))
+    assert adj_df['adjusted_score'].isna().all()
@@ -0,0 +1,61 @@
+# Test the ncpt command-line interface
+import os
+import sys
+import subprocess
+
+import pandas as pd
+
+from lumos_ncpt_tools.cli import main, outlier_methods
+from lumos_ncpt_tools.mixins import OutliersMixin
+from lumos_ncpt_tools.ncpt import NCPT
+from lumos_ncpt_tools.utils import load_test_data
+
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_help_is_lazy():
+    # --help must not import the heavy dependencies
+    code = ('import sys\n'
+            'from lumos_ncpt_tools.cli import main\n'
+            'try:\n'
+            '    main(["--help"])\n'
+            'except SystemExit:\n'
+            '    pass\n'
+            'heavy = ["numpy", "pandas", "yaml", "matplotlib", "seaborn", "statsmodels"]\n'
+            'print("loaded:" + ",".join(m for m in heavy if m in sys.modules))\n')
+    out = subprocess.run([sys.executable, '-c', code], cwd=repo_dir, capture_output=True,
+                         text=True, check=True)
+    assert 'usage: ncpt' in out.stdout
+    assert out.stdout.strip().splitlines()[-1] == 'loaded:'
+
+
+def test_outlier_methods():
+    assert set(outlier_methods) == OutliersMixin.supported_methods
+
+
+def test_commands(tmp_path, capsys):
+    df = load_test_data()
+    data_path = str(tmp_path / 'test_df.csv')
+    df.to_csv(data_path, index=False)
+
+    out_path = str(tmp_path / 'complete.csv.gz')
+    assert main(['filter-complete', data_path, out_path]) == 0
+    expected, _ = NCPT(df).filter_by_completeness()
+    pd.testing.assert_frame_equal(pd.read_csv(out_path), expected.reset_index(drop=True))
+
+    out_path = str(tmp_path / 'filt.csv')
+    assert main(['filter-outliers', data_path, out_path, '--thresh', '3', '--method', 'IQR',
+                 '--subtests', '29', '30']) == 0
+    expected = NCPT(df).filter_outliers_by_subtest('raw_score', 3, [29, 30], method='IQR')
+    pd.testing.assert_frame_equal(pd.read_csv(out_path), expected.reset_index(drop=True))
+
+    out_path = str(tmp_path / 'converted.csv.bz2')
+    assert main(['convert', data_path, out_path]) == 0
+    pd.testing.assert_frame_equal(pd.read_csv(out_path), df)
+
+    report = NCPT(df).validate()
+    assert main(['validate', data_path, '--chunksize', '100']) == (0 if report.ok else 1)
+
+    assert main(['stats', data_path]) == 0
+    assert f'N subtests: {len(df)}' in capsys.readouterr().out
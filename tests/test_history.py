@@ -0,0 +1,48 @@
+# Test RunHistory
+import pytest
+import numpy as np
+import pandas as pd
+
+from lumos_ncpt_tools.ncpt import NCPT
+from lumos_ncpt_tools.utils import load_test_data
+
+
+def make_repeat_df():
+    # Reassign the test runs to fewer users so that users have 1-4 runs
+    df = load_test_data()
+    run_ids = np.sort(df['test_run_id'].unique())
+    rng = np.random.default_rng(0)
+    run_users = np.repeat(np.arange(len(run_ids)), rng.integers(1, 5, len(run_ids)))
+    user_map = dict(zip(run_ids, run_users[:len(run_ids)]))
+    df['user_id'] = df['test_run_id'].map(user_map)
+    return df.sample(frac=1, random_state=0)
+
+
+def test_history_index():
+    df = make_repeat_df()
+    history = NCPT(df).build_history_index()
+    
+    # Run count distribution
+    ref_counts = df.groupby('user_id')['test_run_id'].nunique()
+    assert history.run_counts().sort_index().equals(ref_counts.rename('n_runs'))
+    assert history.run_count_distribution().sum() == df['user_id'].nunique()
+    
+    # First vs. second attempt, per subtest
+    ref_df = df.sort_values(['user_id', 'test_run_id'])
+    ref_df['attempt'] = ref_df.groupby(['user_id', 'specific_subtest_id']).cumcount()
+    retest = history.retest_correlations()
+    for sub in df['specific_subtest_id'].unique():
+        sub_df = ref_df.query('specific_subtest_id == @sub').set_index('user_id')
+        first = sub_df.query('attempt == 0')['raw_score']
+        second = sub_df.query('attempt == 1')['raw_score']
+        ref_deltas = (second - first.reindex(second.index)).sort_index()
+        deltas = history.retest_deltas(sub).sort_index()
+        assert np.array_equal(deltas.index, ref_deltas.index)
+        assert np.allclose(deltas.values, ref_deltas.values)
+        assert retest.loc[sub, 'N'] == len(ref_deltas)
+        
+    # Single user history
+    user_id = history.run_counts().idxmax()
+    user_df = history.user_runs(user_id)
+    assert len(user_df) == len(df.query('user_id == @user_id'))
+    assert user_df['test_run_id'].is_monotonic_increasing
@@ -1,6 +1,7 @@
 # Test NCPT
 import pytest
 import numpy as np
+import pandas as pd
 
 from lumos_ncpt_tools.ncpt import NCPT
 from lumos_ncpt_tools.utils import load_test_data
@@ -25,3 +26,41 @@ def test_ncpt():
     
     df_to_test, _ = ncpt_removed.filter_by_completeness()
     assert test_id not in df_to_test['test_run_id']
+
+
+def test_pairwise_correlations():
+    df = load_test_data()
+    ncpt = NCPT(df)
+    corrs, n_obs, ci_lo, ci_hi = ncpt.pairwise_correlations(ci=95)
+    
+    # Compare to pandas' pairwise-complete correlations of the wide matrix
+    assert not df.duplicated(subset=['test_run_id', 'specific_subtest_id']).any()
+    wide = df.pivot(index='test_run_id', columns='specific_subtest_id', values='raw_score')
+    assert np.allclose(corrs.values, wide.corr(min_periods=2).values, equal_nan=True)
+    assert np.array_equal(n_obs.values, wide.notna().astype(int).T @ wide.notna().astype(int))
+    valid = n_obs.values > 3
+    assert np.all(ci_lo.values[valid] <= corrs.values[valid] + 1e-12)
+    assert np.all(corrs.values[valid] <= ci_hi.values[valid] + 1e-12)
+
+
+def test_pairwise_correlations_duplicates():
+    df = load_test_data()
+    # Second score for some (test run, subtest) pairs
+    dup_df = df.iloc[::7].copy()
+    dup_df['raw_score'] = dup_df['raw_score'] * 2 + 1
+    all_df = pd.concat([df, dup_df], ignore_index=True)
+    ncpt = NCPT(all_df)
+    with pytest.raises(ValueError):
+        ncpt.pairwise_correlations()
+    
+    keys = ['test_run_id', 'specific_subtest_id']
+    expected = {
+        'drop': all_df[~all_df.duplicated(subset=keys, keep=False)],
+        'first': df,
+        'mean': all_df.groupby(keys, as_index=False)['raw_score'].mean()}
+    for duplicates, exp_df in expected.items():
+        corrs, n_obs, _, _ = ncpt.pairwise_correlations(duplicates=duplicates)
+        wide = exp_df.pivot(index='test_run_id', columns='specific_subtest_id', values='raw_score')
+        wide = wide.reindex(columns=corrs.columns)
+        assert np.allclose(corrs.values, wide.corr(min_periods=2).values, equal_nan=True)
+        assert np.array_equal(n_obs.values, wide.notna().astype(int).T @ wide.notna().astype(int))
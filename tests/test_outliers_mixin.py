@@ -1,21 +1,26 @@
 # Test OutliersMixin
 import pytest
 import numpy as np
+import pandas as pd
 
 from lumos_ncpt_tools.ncpt import NCPT
 from lumos_ncpt_tools.utils import load_test_data
 
 
 test_conditions = [
-    (10e8),
-    (-10e8)
+    (10e8, 'MAD', 90),
+    (-10e8, 'MAD', 90),
+    (10e8, 'robust_z', 93),
+    (-10e8, 'IQR', 98),
+    (10e8, 'Sn', 95),
+    (-10e8, 'Qn', 95)
 ]
 
 @pytest.mark.parametrize(
-    'outlier_val', 
+    'outlier_val, method, n_kept_all', 
     test_conditions
 )
-def test_outliers(outlier_val):
+def test_outliers(outlier_val, method, n_kept_all):
     # Hard-coded parameters
     thresh = 5
     outlier_id = -1
@@ -32,7 +37,25 @@ def test_outliers(outlier_val):
     outlier_df['specific_subtest_id'] = check_subtest
     ncpt.df = ncpt.df.append(outlier_df, ignore_index=True)
     
-    # Filter outliers
-    check_subtests = ncpt.df['specific_subtest_id'].unique()
-    filt_df = ncpt.filter_outliers_by_subtest('raw_score', thresh, [check_subtest])
-    assert outlier_id not in filt_df['test_run_id']
+    # Filter outliers: the outlier is removed, all other test runs are kept
+    filt_df = ncpt.filter_outliers_by_subtest('raw_score', thresh, [check_subtest], method)
+    assert outlier_id not in set(filt_df['test_run_id'])
+    assert set(filt_df['test_run_id']) == set(df['test_run_id'])
+    
+    # Number of test runs kept when screening every subtest of the test data
+    check_subtests = np.sort(ncpt.df['specific_subtest_id'].unique())
+    filt_df = ncpt.filter_outliers_by_subtest('raw_score', thresh, check_subtests, method)
+    assert outlier_id not in set(filt_df['test_run_id'])
+    assert filt_df['test_run_id'].nunique() == n_kept_all
+
+
+@pytest.mark.parametrize('method', ['MAD', 'robust_z', 'IQR', 'Sn', 'Qn'])
+def test_outliers_zero_scale(method):
+    # Heavily tied integer scores: the scale estimate is 0, so no score is an outlier
+    scores = np.r_[np.full(80, 10.0), np.arange(20.0)]
+    df = pd.DataFrame({'test_run_id': np.arange(len(scores)), 'specific_subtest_id': 29,
+                       'raw_score': scores})
+    ncpt = NCPT(df)
+    assert ncpt._outlier_mask(scores, 5, method)[1] == 0
+    filt_df = ncpt.filter_outliers_by_subtest('raw_score', 5, [29], method)
+    assert len(filt_df) == len(df)
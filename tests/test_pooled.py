@@ -0,0 +1,98 @@
+# Test the pooled cross-battery view
+import pytest
+import numpy as np
+import pandas as pd
+
+from lumos_ncpt_tools.pooled import PooledNCPT
+from lumos_ncpt_tools.utils import load_test_data
+from lumos_ncpt_tools.writers import write_df
+
+
+def _write_batteries(data_dir, df, fmt='.csv'):
+    for bat_id, bat_df in df.groupby('battery_id'):
+        if fmt == '.csv':
+            bat_df.to_csv(data_dir / f'battery{bat_id}_df.csv', index=False)
+        elif fmt == '.parquet':
+            write_df(bat_df, str(data_dir / f'battery{bat_id}_df.parquet'))
+        else:
+            write_df(bat_df, str(data_dir / f'battery{bat_id}_df'), fmt='.parquet',
+                     partition_by='specific_subtest_id')
+
+
+def _expected(df, subtests, columns):
+    expected = df[df['specific_subtest_id'].isin(subtests)]
+    return expected.sort_values(['battery_id', 'test_run_id', 'specific_subtest_id'])[columns]
+
+
+def test_tasks():
+    pooled = PooledNCPT('.')
+    assert pooled.tasks['Forward memory span'] == [28, 43]
+    assert pooled.tasks['Go/no-go'] == [26, 32]
+    assert pooled.tasks['Trail making part A'] == [39]
+    assert pooled.task_subtests(45) == [38, 45]
+    with pytest.raises(KeyError):
+        pooled.task_subtests('Not a task')
+
+
+@pytest.mark.parametrize('fmt', ['.csv', '.parquet', 'partitioned'])
+def test_load(tmp_path, fmt):
+    if fmt != '.csv':
+        pytest.importorskip('pyarrow')
+    df = load_test_data()
+    _write_batteries(tmp_path, df, fmt)
+    pooled = PooledNCPT(str(tmp_path), chunksize=50)
+
+    columns = ['user_id', 'gender', 'raw_score']
+    task_df = pooled.load('Digit symbol coding', columns=columns)
+    out_cols = columns + ['battery_id', 'specific_subtest_id']
+    assert list(task_df.columns) == out_cols
+    assert set(task_df['specific_subtest_id']) == {38, 45}
+    assert task_df['gender'].dtype == 'category'
+    assert task_df['specific_subtest_id'].dtype == np.int64
+
+    sort_cols = ['battery_id', 'user_id', 'specific_subtest_id']
+    expected = _expected(df, [38, 45], out_cols).sort_values(sort_cols)
+    actual = task_df.sort_values(sort_cols)
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True).astype({'gender': object}),
+                                  expected.reset_index(drop=True))
+
+    # Battery subset, all columns
+    bat_df = pooled.load(43, batteries=[50])
+    assert set(bat_df['battery_id']) == {50}
+    assert len(bat_df) == ((df['battery_id'] == 50) & (df['specific_subtest_id'] == 43)).sum()
+    assert list(bat_df.columns) == list(df.columns)
+
+
+def test_load_partitioned_variants(tmp_path):
+    pytest.importorskip('pyarrow')
+    df = load_test_data()
+    float_dir, battery_dir = tmp_path / 'float', tmp_path / 'battery'
+    float_dir.mkdir()
+    battery_dir.mkdir()
+    for bat_id, bat_df in df.groupby('battery_id'):
+        # Partitioned by a float subtest ID column ('specific_subtest_id=38.0')
+        float_df = bat_df.astype({'specific_subtest_id': 'float64'})
+        write_df(float_df, str(float_dir / f'battery{bat_id}_df'), fmt='.parquet',
+                 partition_by='specific_subtest_id')
+        # Not partitioned by subtest
+        write_df(bat_df, str(battery_dir / f'battery{bat_id}_df'), fmt='.parquet',
+                 partition_by='user_id')
+
+    expected = df[df['specific_subtest_id'].isin([38, 45])]
+    for data_dir in [float_dir, battery_dir]:
+        task_df = PooledNCPT(str(data_dir)).load('Digit symbol coding')
+        assert len(task_df) == len(expected)
+        assert set(task_df['specific_subtest_id']) == {38, 45}
+        assert task_df['specific_subtest_id'].dtype == np.int64
+
+
+def test_load_empty(tmp_path):
+    df = load_test_data()
+    df[df['battery_id'] == 25].to_csv(tmp_path / 'battery25_df.csv', index=False)
+    pooled = PooledNCPT(str(tmp_path))
+    task_df = pooled.load('Digit symbol coding')
+    assert len(task_df) == 0
+    assert task_df.dtypes.astype(str).to_dict() == pooled.dtypes
+    task_df = pooled.load('Digit symbol coding', columns=['raw_score'])
+    assert task_df.columns.tolist() == ['raw_score', 'battery_id', 'specific_subtest_id']
+    assert task_df['raw_score'].dtype == np.float64
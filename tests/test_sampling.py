@@ -0,0 +1,35 @@
+# Test stratified sampling
+import pytest
+import numpy as np
+import pandas as pd
+
+from lumos_ncpt_tools.ncpt import NCPT
+from lumos_ncpt_tools.sampling import stratified_sample, _strata_codes, AGE_BINS, EDU_BINS, GENDERS
+from lumos_ncpt_tools.utils import load_test_data
+
+
+def test_stratified_sample(tmp_path):
+    frac = 0.3
+    df = load_test_data()
+    df.to_csv(tmp_path / 'test_df.csv', index=False)
+    
+    sample = stratified_sample(str(tmp_path), 'test_df.csv', frac, seed=3, chunksize=50)
+    assert isinstance(sample, NCPT)
+    sample_df = sample.df
+    
+    # Independent of the chunk size
+    other = stratified_sample(str(tmp_path), 'test_df.csv', frac, seed=3, chunksize=10000)
+    assert sample_df.reset_index(drop=True).equals(other.df.reset_index(drop=True))
+    
+    # Test runs are sampled whole
+    sample_runs = sample_df['test_run_id'].unique()
+    full_counts = df.query('test_run_id in @sample_runs').groupby('test_run_id').size()
+    assert sample_df.groupby('test_run_id').size().equals(full_counts)
+    
+    # round(frac x N) test runs per stratum
+    def stratum_counts(data):
+        runs = data.drop_duplicates(subset=['test_run_id'])
+        return pd.Series(_strata_codes(runs, AGE_BINS, EDU_BINS, GENDERS)).value_counts()
+    n_full = stratum_counts(df)
+    n_sample = stratum_counts(sample_df).reindex(n_full.index, fill_value=0)
+    assert np.array_equal(n_sample.values, np.round(frac * n_full.values))
@@ -0,0 +1,58 @@
+# Test robust statistics
+import pytest
+import numpy as np
+
+from lumos_ncpt_tools.stats import quantiles, sn_scale, qn_scale, bootstrap_ci
+
+
+def naive_sn(x):
+    n = len(x)
+    diffs = np.sort(np.abs(x[:, None] - x[None, :]), axis=1)
+    return np.sort(diffs[:, n // 2])[(n + 1) // 2 - 1]
+
+
+def naive_qn(x):
+    n = len(x)
+    h = n // 2 + 1
+    i, j = np.triu_indices(n, 1)
+    return np.sort(np.abs(x[i] - x[j]))[h * (h - 1) // 2 - 1]
+
+
+@pytest.mark.parametrize(
+    'n, discrete', 
+    [(2, False), (7, True), (50, False), (51, True), (400, False), (401, True)]
+)
+def test_scale_estimators(n, discrete):
+    rng = np.random.default_rng(n)
+    if discrete:
+        # Heavily tied scores, typical of the NCPT raw scores
+        x = rng.integers(0, 10, n) * 0.1
+    else:
+        x = rng.normal(size=n)
+    assert np.isclose(sn_scale(x, correct=False), naive_sn(x))
+    assert np.isclose(qn_scale(x, correct=False), naive_qn(x))
+    qs = [0.1, 0.25, 0.5, 0.75, 0.9]
+    assert np.allclose(quantiles(x, qs), np.percentile(x, np.array(qs) * 100))
+    
+
+def test_scale_consistency():
+    # Sn and Qn estimate the SD for Gaussian data
+    x = np.random.default_rng(0).normal(scale=3, size=20000)
+    assert np.isclose(sn_scale(x), 3, rtol=0.05)
+    assert np.isclose(qn_scale(x), 3, rtol=0.05)
+
+
+def test_bootstrap_ci():
+    rng = np.random.default_rng(0)
+    samples = [rng.normal(size=n) for n in [0, 20, 500, 3000]]
+    pctiles = [10, 50, 90]
+    cis = bootstrap_ci(samples, pctiles, n_boot=200, seed=[1, 2], n_jobs=4)
+    assert cis.shape == (4, 5, 2)
+    assert np.isnan(cis[0]).all()
+    # Point estimates fall within the CIs
+    for sample, sample_cis in zip(samples[1:], cis[1:]):
+        point = [np.mean(sample), np.std(sample)] + list(np.percentile(sample, pctiles))
+        assert np.all((sample_cis[:, 0] <= point) & (point <= sample_cis[:, 1]))
+    # Reproducible, independent of the number of threads and of the batch size
+    assert np.array_equal(cis, bootstrap_ci(samples, pctiles, n_boot=200, seed=[1, 2], n_jobs=1,
+                                            max_elements=10000), equal_nan=True)
@@ -0,0 +1,61 @@
+# Test data loading
+import os
+import tracemalloc
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from lumos_ncpt_tools.utils import load_data, load_test_data
+
+
+def assert_same_values(df, ref_df):
+    assert df.columns.tolist() == ref_df.columns.tolist()
+    for col in ref_df.columns:
+        if ref_df[col].dtype == object:
+            assert df[col].astype(object).fillna('NA').tolist() == ref_df[col].fillna('NA').tolist()
+        else:
+            assert np.array_equal(df[col].to_numpy(dtype=float), ref_df[col].to_numpy(dtype=float),
+                                  equal_nan=True)
+
+
+def test_load_data_max_memory(tmp_path):
+    df = load_test_data()
+    # Missing values late in the file force columns to be upcast
+    df.loc[len(df) - 1, ['age', 'gender']] = [np.nan, np.nan]
+    df.loc[len(df) - 2, 'raw_score'] = 0.85
+    df.to_csv(tmp_path / 'test_df.csv', index=False)
+    ref_df = load_data(str(tmp_path), 'test_df.csv')
+    
+    budget_df = load_data(str(tmp_path), 'test_df.csv', max_memory='2MB')
+    assert_same_values(budget_df, ref_df)
+    assert budget_df.memory_usage(deep=True).sum() < ref_df.memory_usage(deep=True).sum()
+    assert 0 < budget_df.attrs['load_est_peak_bytes'] <= 2e6
+    
+    n_df = load_data(str(tmp_path), 'test_df.csv', nrows=100, max_memory='2MB')
+    assert_same_values(n_df, ref_df.iloc[:100])
+    
+    # Fail early if the data cannot fit, or spill to disk
+    with pytest.raises(MemoryError):
+        load_data(str(tmp_path), 'test_df.csv', max_memory='10KB')
+    spill_dir = tmp_path / 'spill'
+    spill_dir.mkdir()
+    spill_df = load_data(str(tmp_path), 'test_df.csv', max_memory='1.5MB', spill_dir=str(spill_dir))
+    assert_same_values(spill_df, ref_df)
+    assert isinstance(spill_df['user_id'].values, np.memmap)
+    assert len(list(spill_dir.iterdir())) == len(ref_df.select_dtypes('number').columns)
+
+
+@pytest.mark.parametrize('budget', [3e6, 5e6, 2e7])
+def test_load_data_measured_peak(budget):
+    # The memory traced while loading stays within the budget and the estimate
+    data_path = os.path.join(os.path.dirname(__file__), '..')
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        df = load_data(data_path, 'demo_data.csv', max_memory=budget)
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    assert len(df) == 36048
+    assert peak <= df.attrs['load_est_peak_bytes'] <= budget
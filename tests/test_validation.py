@@ -0,0 +1,47 @@
+# Test data validation
+import pytest
+import numpy as np
+import pandas as pd
+
+from lumos_ncpt_tools.ncpt import NCPT
+from lumos_ncpt_tools.utils import load_test_data, iter_chunks
+
+
+def make_bad_df():
+    df = load_test_data()
+    run_rows = df.groupby('test_run_id').indices
+    run_ids = list(run_rows)
+    # Subtest that is not part of the battery (battery 60 has no subtest 38)
+    df.loc[run_rows[run_ids[0]][0], ['battery_id', 'specific_subtest_id']] = [60, 38]
+    # Duplicated subtest row
+    df = pd.concat([df, df.loc[[run_rows[run_ids[1]][0]]]]).sort_values(
+        'test_run_id', kind='stable').reset_index(drop=True)
+    # Inconsistent demographics within a run
+    df.loc[df.index[df['test_run_id'] == run_ids[2]][0], 'age'] = 35
+    # Out of range age / unknown education level, for all rows of a run
+    df.loc[df['test_run_id'] == run_ids[3], 'age'] = 150
+    df.loc[df['test_run_id'] == run_ids[4], 'education_level'] = 42
+    return df, run_ids
+
+
+def test_validation(tmp_path):
+    df, run_ids = make_bad_df()
+    ncpt = NCPT(df)
+    report = ncpt.validate()
+    counts = report.counts
+    
+    assert counts['subtest_not_in_battery'] == 1
+    assert counts['duplicate_subtest'] == 2
+    # First run (battery changed on one row) and third run (age changed on one row)
+    inconsistent = df.loc[report.mask('inconsistent_run'), 'test_run_id'].unique()
+    assert set(inconsistent) == {run_ids[0], run_ids[2]}
+    assert counts['age_out_of_range'] == (df['test_run_id'] == run_ids[3]).sum()
+    assert counts['invalid_education'] == (df['test_run_id'] == run_ids[4]).sum()
+    assert counts['unknown_battery'] == 0 and counts['unknown_subtest'] == 0
+    
+    # Streaming mode gives the same report
+    df.to_csv(tmp_path / 'bad_df.csv', index=False)
+    stream_report = ncpt.validate(chunks=iter_chunks(str(tmp_path), 'bad_df.csv', chunksize=37))
+    assert stream_report.n_rows == len(df)
+    for rule, rows in report.rows.items():
+        assert np.array_equal(stream_report.rows[rule], rows)
@@ -0,0 +1,94 @@
+# Test writers
+import os
+
+import pytest
+import numpy as np
+import pandas as pd
+
+from lumos_ncpt_tools.ncpt import NCPT
+from lumos_ncpt_tools.utils import load_test_data
+from lumos_ncpt_tools.writers import write_df, read_manifest, read_part, check_manifest
+
+
+def read_output(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    elif path.endswith('.feather'):
+        return pd.read_feather(path)
+    return pd.read_csv(path)
+
+
+@pytest.mark.parametrize(
+    'fmt', 
+    ['.csv', '.csv.gz', '.csv.xz', '.parquet', '.feather']
+)
+def test_write_df(tmp_path, fmt):
+    if fmt in ['.parquet', '.feather']:
+        pytest.importorskip('pyarrow')
+    df = load_test_data()
+    save_path = str(tmp_path / f'test_df{fmt}')
+    manifest = write_df(df, save_path, chunksize=100)
+    assert read_output(save_path).equals(df)
+    assert manifest == read_manifest(save_path)
+    assert manifest['n_rows'] == len(df)
+    assert check_manifest(save_path, columns=df.iloc[:0])
+    assert not check_manifest(save_path, columns=df.iloc[:0, 1:])
+    
+    
+def test_save_df_partitioned(tmp_path):
+    df = load_test_data()
+    ncpt = NCPT(df)
+    filt_df, _ = ncpt.filter_by_completeness()
+    mask = df.index.isin(filt_df.index)
+    save_dir = str(tmp_path / 'partitioned')
+    ncpt.save_df(save_dir, fmt='.csv.gz', mask=mask, 
+                 partition_by=['battery_id', 'specific_subtest_id'], n_jobs=4, chunksize=10)
+    
+    manifest = read_manifest(save_dir)
+    assert manifest['n_rows'] == len(filt_df)
+    assert len(manifest['files']) == len(filt_df.groupby(['battery_id', 'specific_subtest_id']))
+    assert manifest['files'][0]['path'] == os.path.join(
+        'battery_id=14', 'specific_subtest_id=26', 'part-0.csv.gz')
+    # Partition columns are only stored in the directory names
+    part = read_output(os.path.join(save_dir, manifest['files'][0]['path']))
+    assert 'battery_id' not in part.columns and 'specific_subtest_id' not in part.columns
+    parts = [read_part(save_dir, f) for f in manifest['files']]
+    assert all(len(part) == f['n_rows'] for part, f in zip(parts, manifest['files']))
+    out_df = pd.concat(parts).sort_values(['test_run_id', 'specific_subtest_id'])
+    ref_df = filt_df.sort_values(['test_run_id', 'specific_subtest_id'])
+    pd.testing.assert_frame_equal(out_df.reset_index(drop=True), ref_df.reset_index(drop=True))
+    
+    sub_df = read_part(save_dir, manifest['files'][0], columns=['raw_score', 'battery_id'])
+    assert sub_df.columns.tolist() == ['raw_score', 'battery_id']
+    
+    # Modified files are detected
+    assert check_manifest(save_dir)
+    with open(os.path.join(save_dir, manifest['files'][0]['path']), 'ab') as f:
+        f.write(b'0')
+    assert not check_manifest(save_dir)
+
+
+def test_partitioned_parquet_hive(tmp_path):
+    pytest.importorskip('pyarrow')
+    df = load_test_data()
+    df.loc[df.index[:5], 'age'] = np.nan
+    save_dir = str(tmp_path / 'partitioned')
+    partition_by = ['battery_id', 'specific_subtest_id']
+    write_df(df, save_dir, fmt='.parquet', partition_by=partition_by)
+    
+    # Standard readers load the partitioned directory
+    out_df = pd.read_parquet(save_dir)
+    assert len(out_df) == len(df)
+    assert sorted(out_df.columns) == sorted(df.columns)
+    sort_cols = ['test_run_id', 'specific_subtest_id']
+    out_df = out_df[df.columns].astype({col: 'int64' for col in partition_by})
+    pd.testing.assert_frame_equal(out_df.sort_values(sort_cols).reset_index(drop=True),
+                                  df.sort_values(sort_cols).reset_index(drop=True))
+    
+    # Missing partition values are kept
+    age_dir = str(tmp_path / 'by_age')
+    manifest = write_df(df, age_dir, fmt='.parquet', partition_by='age')
+    assert manifest['n_rows'] == len(df)
+    null_files = [f for f in manifest['files'] if '__HIVE_DEFAULT_PARTITION__' in f['path']]
+    assert len(null_files) == 1
+    assert read_part(age_dir, null_files[0])['age'].isna().all()